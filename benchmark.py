@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# benchmark.py: time reading the train trips, building the index and searching routes with
+#               findRoute.py, on the shipped schedule and on synthetic schedules
+# usage: benchmark.py [-c earlier-results] [-o results-file] [-q] [-s scales] [-t seconds]
+# -c: compare with the results file of an earlier run: report slower searches and shorter routes
+# -o: write the results in JSON format to this file (default: benchmark.json)
+# -q: quick run: only the cases of the shipped schedule without reference check
+# -s: synthetic schedules, separated by commas: network copies x trip frequency (default: 10x1,1x10)
+# -t: time limit per search in seconds (default: 120)
+# note: exit code 1 when a reference route was not found or the comparison with earlier results found regressions
+# note: each case runs findRoute.py -n --stats in a new directory, so the index is built every time
+
+import getopt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import traintrips
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIND_ROUTE = os.path.join(DIRECTORY, "findRoute.py")
+RESULTS_FILE_NAME = "benchmark.json"
+DATA_FILES = ["stations", "transfers", "partners", "can_travel_back", "next_destinations", "required_visits"]
+SCALES = "10x1,1x10"
+TIME_LIMIT = 120
+SLOWER_FACTOR = 1.2  # searches taking this many times longer than in the earlier results are regressions
+# first station, start time and beam size of the searches on the shipped schedule
+CASES = [("groningen", "00:00", 0), ("groningen", "00:00", 10), ("shertogenbosch", "00:48", 5)]
+# searches that should find a known route (file name), continuing from its first lines (-H), on the shipped schedule
+REFERENCES = [("routes-2023-longest-unchecked", 20, 20)]
+HISTORY_FILE_NAME = "history"
+SYNTHETIC_CASE = ("groningen", "00:00", 0)
+# the tracks between copies of the network are fast, so that the routes of the synthetic case visit all copies
+LINK_DISTANCE = 40.0  # length of the tracks between copies of the network
+LINK_INTERVAL = 30  # minutes between the trips between copies of the network
+LINK_DURATION = 10
+LAST_LINK_TIME = 26 * 60
+
+
+def read_routes(lines):
+    """the routes in the lines of a route file or of the output of findRoute.py: list of (trip lines, distance)"""
+    routes = []
+    route = []
+    for line in lines:
+        if line.startswith("# largest distance :"):
+            if len(route) > 0:
+                routes.append((route, float(line.split()[-1])))
+            route = []
+        elif len(line.split()) >= 8 and not line.startswith("#"):
+            route.append(line.rstrip("\n"))
+    return routes
+
+
+def read_reference(file_name):
+    """trip lines and distance of the longest route in a route file"""
+    with open(os.path.join(DIRECTORY, file_name), "r") as route_file:
+        return max(read_routes(route_file), key=lambda route: route[1])
+
+
+def copy_name(station, copy):
+    return station if copy == 0 else f"{station}{copy}"
+
+
+def write_copies(source_file_name, target_file_name, copies, station_fields):
+    """copy a data file for all copies of the network, renaming the stations in station_fields"""
+    with open(source_file_name, "r") as source_file:
+        lines = [line.split() for line in source_file if line.strip() != "" and not line.startswith("#")]
+    with open(target_file_name, "w") as target_file:
+        for copy in range(copies):
+            for fields in lines:
+                renamed = [copy_name(field, copy) if i in station_fields(len(fields)) else field
+                           for i, field in enumerate(fields)]
+                print(" ".join(renamed), file=target_file)
+
+
+def frequent_trips(trips, frequency):
+    """the trips of a track with frequency - 1 extra trips between each trip and the next"""
+    times = set()
+    for i, trip in enumerate(trips):
+        interval = trips[i + 1].start_time - trip.start_time if i + 1 < len(trips) else 60
+        for j in range(frequency):
+            shift = j * interval // frequency
+            times.add((trip.start_time + shift, trip.end_time + shift, trip.transfers, trip.travel_time))
+    return sorted(times)
+
+
+def make_synthetic_schedule(target_directory, copies, frequency):
+    """write a schedule with copies of the network, linked at their busiest station, and frequency
+       times as many trips to target_directory, plus the matching data files; return the number of trips"""
+    tracks = []
+    with open(os.path.join(DIRECTORY, traintrips.DATA_FILE_NAME), "r") as data_file:
+        for record in traintrips.read_trips(data_file):
+            if isinstance(record, traintrips.Track):
+                tracks.append((record, []))
+            else:
+                tracks[-1][1].append(record)
+    hub = Counter(track.start_station for track, trips in tracks).most_common(1)[0][0]
+    nbr_of_trips = 0
+    with open(os.path.join(target_directory, traintrips.DATA_FILE_NAME), "w") as data_file:
+        for copy in range(copies):
+            for track, trips in tracks:
+                print(f"# {track.distance} {copy_name(track.start_station, copy)} {copy_name(track.end_station, copy)}",
+                      file=data_file)
+                for start_time, end_time, transfers, travel_time in frequent_trips(trips, frequency):
+                    print(traintrips.format_trip(start_time, end_time, transfers, travel_time), file=data_file)
+                    nbr_of_trips += 1
+        for copy in range(1, copies):
+            for start_station, end_station in [(copy_name(hub, copy - 1), copy_name(hub, copy)),
+                                               (copy_name(hub, copy), copy_name(hub, copy - 1))]:
+                print(f"# {LINK_DISTANCE} {start_station} {end_station}", file=data_file)
+                for start_time in range(0, LAST_LINK_TIME, LINK_INTERVAL):
+                    print(traintrips.format_trip(start_time, start_time + LINK_DURATION, 0, LINK_DURATION),
+                          file=data_file)
+                    nbr_of_trips += 1
+    with open(os.path.join(DIRECTORY, "stations"), "r") as source_file:
+        stations = [line.strip() for line in source_file if line.strip() != ""]
+    with open(os.path.join(target_directory, "stations"), "w") as target_file:
+        for copy in range(copies):
+            for station in stations:
+                print(copy_name(station, copy), file=target_file)
+    write_copies(os.path.join(DIRECTORY, "transfers"), os.path.join(target_directory, "transfers"), copies,
+                 lambda nbr_of_fields: range(1, 5))
+    write_copies(os.path.join(DIRECTORY, "partners"), os.path.join(target_directory, "partners"), copies,
+                 lambda nbr_of_fields: range(0, 4))
+    write_copies(os.path.join(DIRECTORY, "can_travel_back"), os.path.join(target_directory, "can_travel_back"), copies,
+                 lambda nbr_of_fields: range(0, nbr_of_fields))
+    if os.path.exists(os.path.join(DIRECTORY, "next_destinations")):
+        write_copies(os.path.join(DIRECTORY, "next_destinations"), os.path.join(target_directory, "next_destinations"),
+                     copies, lambda nbr_of_fields: range(0, nbr_of_fields))
+    return nbr_of_trips
+
+
+def prepare_shipped_schedule(target_directory):
+    """copy the shipped schedule and data files to target_directory; return the number of trips"""
+    shutil.copy(os.path.join(DIRECTORY, traintrips.DATA_FILE_NAME), target_directory)
+    for file_name in DATA_FILES:
+        if os.path.exists(os.path.join(DIRECTORY, file_name)):
+            shutil.copy(os.path.join(DIRECTORY, file_name), target_directory)
+    with open(os.path.join(target_directory, traintrips.DATA_FILE_NAME), "r") as data_file:
+        return sum(1 for record in traintrips.read_trips(data_file) if isinstance(record, traintrips.Trip))
+
+
+def run_case(name, prepare, first_station, start_time, beam_size, time_limit, history=None):
+    """run findRoute.py in a new directory prepared by the function prepare, continuing from the trip lines
+       history if given; return the case results and the stations of the longest route"""
+    with tempfile.TemporaryDirectory() as directory:
+        nbr_of_trips = prepare(directory)
+        # findRoute.py needs this file, it may be empty
+        if not os.path.exists(os.path.join(directory, "next_destinations")):
+            open(os.path.join(directory, "next_destinations"), "w").close()
+        if history is None:
+            start_options = ["-f", first_station, "-s", start_time]
+        else:
+            with open(os.path.join(directory, HISTORY_FILE_NAME), "w") as history_file:
+                print("\n".join(history), file=history_file)
+            start_options = ["-H", HISTORY_FILE_NAME]
+        command = [sys.executable, FIND_ROUTE, "-n", "-b", str(beam_size), "--time-limit", str(time_limit),
+                   "--stats", "stats.json"] + start_options
+        start = time.time()
+        with open(os.path.join(directory, traintrips.DATA_FILE_NAME), "r") as data_file:
+            process = subprocess.run(command, stdin=data_file, stdout=subprocess.PIPE, cwd=directory, text=True)
+        seconds = time.time() - start
+        if process.returncode != 0:
+            sys.exit(f"benchmark.py: findRoute.py failed for case {name}")
+        with open(os.path.join(directory, "stats.json"), "r") as stats_file:
+            stats = json.load(stats_file)
+    routes = read_routes(process.stdout.splitlines())
+    route_stations = {station for line in routes[-1][0] for station in line.split()[6:8]} if len(routes) > 0 else set()
+    search_seconds = stats["seconds"]["search"]
+    result = {"name": name, "first_station": first_station, "start_time": start_time, "beam_size": beam_size,
+              "trips": nbr_of_trips, "read_seconds": stats["seconds"]["read"], "index_seconds": stats["seconds"]["index"],
+              "search_seconds": search_seconds, "total_seconds": seconds, "steps": stats["steps"], "nodes": stats["nodes"],
+              "nodes_per_second": stats["nodesPerSecond"], "steps_per_second": stats["steps"] / search_seconds if search_seconds > 0 else 0.0,
+              "first_route_seconds": stats["firstRouteSeconds"], "best_route_seconds": stats["bestRouteSeconds"],
+              "longest_route": stats["longestRoute"], "stopped": stats["stopped"]}
+    print(f"{name}: {result['longest_route']:0.1f} km, read {result['read_seconds']:0.1f} s, "
+          f"index {result['index_seconds']:0.1f} s, search {search_seconds:0.1f} s, "
+          f"{result['nodes_per_second']:0.0f} nodes/s{'' if result['stopped'] is None else ', stopped'}", flush=True)
+    return result, route_stations
+
+
+def parse_scales(scales):
+    """network copies and trip frequencies of the synthetic schedules, for example 10x1,1x10"""
+    return [tuple(int(number) for number in scale.split("x")) for scale in scales.split(",") if scale != ""]
+
+
+def network_copy(station):
+    """the number of the network copy of a station of a synthetic schedule"""
+    number = station[len(station.rstrip("0123456789")):]
+    return int(number) if number != "" else 0
+
+
+def run_benchmark(scales, time_limit, quick):
+    cases = []
+    for first_station, start_time, beam_size in CASES:
+        result, route_stations = run_case(f"shipped {first_station} {start_time} beam {beam_size}",
+                                          prepare_shipped_schedule, first_station, start_time, beam_size, time_limit)
+        cases.append(result)
+    if not quick:
+        for file_name, history_length, beam_size in REFERENCES:
+            route, distance = read_reference(file_name)
+            first_station, start_time = route[0].split()[6], route[0].split()[0]
+            result, route_stations = run_case(f"reference {file_name} first {history_length} trips beam {beam_size}",
+                                              prepare_shipped_schedule, first_station, start_time, beam_size,
+                                              time_limit, route[:history_length])
+            result.update({"reference": file_name, "reference_distance": distance,
+                           "reference_found": result["longest_route"] >= distance})
+            print(f"{file_name}: {distance:0.1f} km {'found' if result['reference_found'] else 'not found'}")
+            cases.append(result)
+        first_station, start_time, beam_size = SYNTHETIC_CASE
+        for copies, frequency in scales:
+            result, route_stations = run_case(f"synthetic {copies}x{frequency} beam {beam_size}",
+                                              lambda directory: make_synthetic_schedule(directory, copies, frequency),
+                                              first_station, start_time, beam_size, time_limit)
+            copies_visited = len({network_copy(station) for station in route_stations})
+            result.update({"network_copies": copies, "trip_frequency": frequency, "network_copies_visited": copies_visited})
+            print(f"synthetic {copies}x{frequency}: the longest route visits {copies_visited} of {copies} network copies")
+            cases.append(result)
+    return cases
+
+
+def git_version():
+    try:
+        process = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=DIRECTORY, capture_output=True, text=True)
+    except OSError:
+        return None
+    return process.stdout.strip() if process.returncode == 0 else None
+
+
+def compare(cases, earlier_cases):
+    """regressions with respect to earlier results: slower searches and shorter longest routes"""
+    earlier = {case["name"]: case for case in earlier_cases}
+    regressions = []
+    for case in cases:
+        if case["name"] not in earlier:
+            continue
+        old = earlier[case["name"]]
+        if case["longest_route"] < old["longest_route"]:
+            regressions.append(f"{case['name']}: longest route {case['longest_route']:0.1f} km, was {old['longest_route']:0.1f} km")
+        for field in ["index_seconds", "search_seconds"]:
+            # searches stopped by the time limit take as long as the limit
+            if case["stopped"] is None and old["stopped"] is None and case[field] > SLOWER_FACTOR * old[field] + 0.1:
+                regressions.append(f"{case['name']}: {field} {case[field]:0.2f}, was {old[field]:0.2f}")
+    return regressions
+
+
+def main(argv):
+    options, args = getopt.getopt(argv, "c:o:qs:t:")
+    options = dict(options)
+    scales = parse_scales(options.get("-s", SCALES))
+    time_limit = float(options.get("-t", TIME_LIMIT))
+    cases = run_benchmark(scales, time_limit, "-q" in options)
+    results = {"version": git_version(), "python": platform.python_version(), "machine": platform.machine(),
+               "date": time.strftime("%Y-%m-%d %H:%M:%S"), "time_limit": time_limit, "cases": cases}
+    with open(options.get("-o", RESULTS_FILE_NAME), "w") as results_file:
+        print(json.dumps(results, indent=1), file=results_file)
+    regressions = [f"{case['name']}: longest route {case['longest_route']:0.1f} km, "
+                   f"reference {case['reference_distance']:0.1f} km" for case in cases if case.get("reference_found") is False]
+    if "-c" in options:
+        with open(options["-c"], "r") as earlier_file:
+            regressions += compare(cases, json.load(earlier_file)["cases"])
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,95 +1,159 @@
 #!/usr/bin/env python3
 # check_traintrips.py: sanity checks for the file traintrips.txt
-# usage: check_traintrips.py
+# usage: check_traintrips.py [-j] [file]
+# -j: write the report in JSON format
+# note: exit code 1 when errors were found (not for warnings)
 # 20230913 erikt(at)xs4all.nl
 
-import re
+import getopt
+import json
 import sys
+from array import array
+from itertools import combinations
+from statistics import median
 
-DATA_FILE_NAME = "traintrips.txt"
-
-def subtract_times(start_time, end_time, track):
-    try:
-        start_hour, start_minute = start_time.split(":")
-        end_hour, end_minute = end_time.split(":")
-    except:
-        sys.exit(f"time format error for:{start_time} {end_time} {track}")
-    return 60 * (int(end_hour) - int(start_hour)) + int(end_minute) - int(start_minute)
-
-
-def read_data(data_file_name=DATA_FILE_NAME):
-    data_file = open(data_file_name, "r")
-    track = ""
-    travel_times = {}
-    tracks = {}
-    for line in data_file:
-        if re.search("^#", line):
-            fields = line.strip().split()
-            track = f"{fields[2]} {fields[3]}"
-        else:
-            start_time = line.strip()
-            end_time = data_file.readline().strip()
-            nbr_of_minutes = subtract_times(start_time, end_time, track)
-            data_file.readline()
-            data_file.readline()
-            travel_time = f"{start_time} {end_time}"
-            if travel_time not in travel_times:
-                travel_times[travel_time] = []
-            travel_times[travel_time].append(track)
-            if track not in tracks:
-                tracks[track] = []
-            if nbr_of_minutes not in tracks[track]:
-                tracks[track].append(nbr_of_minutes)
-    return travel_times, tracks
-
-
-def show_travel_times(travel_times):
+import traintrips
+from traintrips import minutes_to_time
+
+DATA_FILE_NAME = traintrips.DATA_FILE_NAME
+DURATION_FACTOR = 2  # trips taking this many times the median trip of the track or more are outliers
+LAST_HOUR = 23  # the last trip of a track should start in this hour
+SEVERITIES = {"start_end": "error", "order": "error", "gap": "warning", "last_hour": "warning",
+              "duplicate": "warning", "duration": "warning"}
+
+
+def load_schedule(data_file_name=DATA_FILE_NAME):
+    """read the trips of a train trips file in columns, one array per field"""
+    tracks = []
+    schedule = {"track": array("i"), "start_time": array("i"), "end_time": array("i"), "line_number": array("i")}
+    with open(data_file_name, "r") as data_file:
+        for record in traintrips.read_trips(data_file, data_file_name):
+            if isinstance(record, traintrips.Track):
+                tracks.append(f"{record.start_station} {record.end_station}")
+            else:
+                schedule["track"].append(len(tracks) - 1)
+                schedule["start_time"].append(record.start_time)
+                schedule["end_time"].append(record.end_time)
+                schedule["line_number"].append(record.line_number)
+    return tracks, schedule
+
+
+def track_ranges(tracks, schedule):
+    """return the first and last position + 1 of the trips of each track in the schedule"""
+    ranges = [(0, 0)] * len(tracks)
+    first = 0
+    track_column = schedule["track"]
+    for i in range(1, len(track_column) + 1):
+        if i == len(track_column) or track_column[i] != track_column[first]:
+            ranges[track_column[first]] = (first, i)
+            first = i
+    return ranges
+
+
+def issue(check, tracks, schedule, i, message):
+    return {"check": check, "severity": SEVERITIES[check], "line": schedule["line_number"][i],
+            "track": tracks[schedule["track"][i]], "message": message}
+
+
+def check_start_end(tracks, schedule):
+    start_times, end_times = schedule["start_time"], schedule["end_time"]
+    return [issue("start_end", tracks, schedule, i,
+                  f"start time {minutes_to_time(start_times[i])} not before end time {minutes_to_time(end_times[i])}")
+            for i in range(len(start_times)) if start_times[i] >= end_times[i]]
+
+
+def check_order(tracks, schedule, ranges):
+    start_times = schedule["start_time"]
+    return [issue("order", tracks, schedule, i,
+                  f"start time {minutes_to_time(start_times[i])} before previous {minutes_to_time(start_times[i-1])}")
+            for first, last in ranges for i in range(first + 1, last) if start_times[i] < start_times[i-1]]
+
+
+def check_gaps(tracks, schedule, ranges):
+    """hours without trips and tracks without trips late in the day"""
+    start_times = schedule["start_time"]
+    issues = []
+    for first, last in ranges:
+        last_hour = 0
+        for i in range(first, last):
+            this_hour = start_times[i] // 60
+            if this_hour > last_hour + 1:
+                previous = minutes_to_time(start_times[i-1]) if i > first else minutes_to_time(0)
+                issues.append(issue("gap", tracks, schedule, i,
+                                    f"no trips between {previous} and {minutes_to_time(start_times[i])}"))
+            last_hour = this_hour
+        if last > first and last_hour < LAST_HOUR:
+            issues.append(issue("last_hour", tracks, schedule, last - 1,
+                                f"last trip starts at {minutes_to_time(start_times[last-1])}"))
+    return issues
+
+
+def check_duplicates(tracks, schedule):
+    """pairs of tracks with trips with the same start and end time"""
+    start_times, end_times, track_column = schedule["start_time"], schedule["end_time"], schedule["track"]
+    order = sorted(range(len(start_times)), key=lambda i: (start_times[i], end_times[i], track_column[i]))
     pairs = {}
-    for travel_time in travel_times:
-        if len(travel_times[travel_time]) > 1:
-            for track_1 in travel_times[travel_time]:
-                for track_2 in travel_times[travel_time]:
-                    if track_1 != track_2:
-                        pair = f"{track_1} {track_2}"
-                        if pair not in pairs:
-                            pairs[pair] = 0
-                        pairs[pair] += 1
-    for pair in pairs:
-        print(f"{pairs[pair]} {pair}")
-
-
-def find_gaps():
-    data_file = open(DATA_FILE_NAME, "r")
-    last_start_time = "00:00"
-    track = ""
-    for line in data_file:
-        if re.search("^#", line):
-            last_hour = int(last_start_time.split(":")[0])
-            if last_hour < 23:
-                print(f"last hour is too small: {last_start_time} {track}")
-            fields = line.strip().split()
-            track = f"{fields[2]} {fields[3]}"
-            last_start_time = "00:00"
-        else:
-            start_time = line.strip()
-            end_time = data_file.readline().strip()
-            data_file.readline()
-            data_file.readline()
-            this_hour = int(start_time.split(":")[0])
-            last_hour = int(last_start_time.split(":")[0])
-            if this_hour < last_hour:
-                print(f"hour is too small: {last_start_time} {start_time} {track}")
-            elif this_hour > last_hour + 1:
-                print(f"hour is too large: {last_start_time} {start_time} {track}")
-            last_start_time = start_time
-
-
-# travel_times, tracks = read_data()
-
-# show_travel_times()
-
-# for track in tracks:
-#     if len(tracks[track]) < 3:
-#         print(track, tracks[track])
-
-find_gaps()
+    first = 0
+    for j in range(1, len(order) + 1):
+        if j == len(order) or (start_times[order[j]], end_times[order[j]]) != \
+                              (start_times[order[first]], end_times[order[first]]):
+            slot_tracks = sorted({track_column[i] for i in order[first:j]})
+            for pair in combinations(slot_tracks, 2):
+                if pair not in pairs:
+                    pairs[pair] = []
+                pairs[pair].append(order[first])
+            first = j
+    return [{"check": "duplicate", "severity": SEVERITIES["duplicate"], "line": schedule["line_number"][trips[0]],
+             "track": tracks[track_1], "other_track": tracks[track_2], "count": len(trips),
+             "message": f"{len(trips)} trips with the same times as on track {tracks[track_2]}"}
+            for (track_1, track_2), trips in sorted(pairs.items())]
+
+
+def check_durations(tracks, schedule, ranges):
+    """trips taking much longer or shorter than the median trip of the track"""
+    start_times, end_times = schedule["start_time"], schedule["end_time"]
+    issues = []
+    for first, last in ranges:
+        if last == first:
+            continue
+        durations = [end_times[i] - start_times[i] for i in range(first, last)]
+        median_duration = median(durations)
+        for i in range(first, last):
+            duration = durations[i - first]
+            if duration >= DURATION_FACTOR * median_duration or DURATION_FACTOR * duration <= median_duration:
+                issues.append(issue("duration", tracks, schedule, i,
+                                    f"trip at {minutes_to_time(start_times[i])} takes {duration} minutes, median {median_duration}"))
+    return issues
+
+
+def check_schedule(data_file_name=DATA_FILE_NAME):
+    """run all checks, return a report"""
+    tracks, schedule = load_schedule(data_file_name)
+    ranges = track_ranges(tracks, schedule)
+    issues = (check_start_end(tracks, schedule) + check_order(tracks, schedule, ranges) +
+              check_gaps(tracks, schedule, ranges) + check_duplicates(tracks, schedule) +
+              check_durations(tracks, schedule, ranges))
+    counts = {check: 0 for check in SEVERITIES}
+    for found in issues:
+        counts[found["check"]] += 1
+    return {"file": data_file_name, "tracks": len(tracks), "trips": len(schedule["track"]),
+            "errors": sum(counts[check] for check in counts if SEVERITIES[check] == "error"),
+            "warnings": sum(counts[check] for check in counts if SEVERITIES[check] == "warning"),
+            "counts": counts, "issues": issues}
+
+
+def main(argv):
+    options, args = getopt.getopt(argv, "j")
+    data_file_name = args[0] if len(args) > 0 else DATA_FILE_NAME
+    report = check_schedule(data_file_name)
+    if ("-j", "") in options:
+        print(json.dumps(report, indent=1))
+    else:
+        for found in report["issues"]:
+            print(f"{found['severity']}: {found['check']}: line {found['line']}: {found['track']}: {found['message']}")
+        print(f"{report['trips']} trips, {report['tracks']} tracks: {report['errors']} errors, {report['warnings']} warnings")
+    return 1 if report["errors"] > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
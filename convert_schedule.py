@@ -6,11 +6,9 @@
 
 import re
 import sys
+import traintrips
 
-def add_day(day_time):
-    hours, minutes = day_time.split(":")
-    hours = int(hours) + 24
-    return f"{hours}:{minutes}"
+MINUTES_PER_DAY = 24 * 60
 
 next_day_started = False
 lines = sys.stdin.readlines()
@@ -31,17 +29,17 @@ for i in range(0, len(lines)):
             i += 1
         if not re.search('\+', line):
             line_parts = line.split()
-            start_time = line_parts[1]
-            end_time = line_parts[3]
+            start_time = traintrips.time_to_minutes(line_parts[1])
+            end_time = traintrips.time_to_minutes(line_parts[3])
             if next_day_started:
-                start_time = add_day(start_time)
-                end_time = add_day(end_time)
+                start_time += MINUTES_PER_DAY
+                end_time += MINUTES_PER_DAY
             if end_time < start_time:
-                end_time = add_day(end_time)
+                end_time += MINUTES_PER_DAY
             nbr_of_transfers = 0
             if line_parts[6] == "met":
                 nbr_of_transfers = line_parts[7]
-            print(f"{start_time}\n{end_time}\n{nbr_of_transfers}\n0:00")
+            print(traintrips.format_trip(start_time, end_time, nbr_of_transfers, 0))
     if re.search("zondag", line):
         next_day_started = True
     if re.search("maandag", line):
@@ -1,86 +1,319 @@
 #!/usr/bin/env python3
 """
    findRoute.py: find longest route with an index of the available train rides
-   usage: findRoute.py [-b beam-size] [-f firstStation] [-h] [-H history-file] [-i] [-n] [-s time] [-S] < traintrips.txt
+   usage: findRoute.py [-a] [-b beam-size] [--different tracks] [-f firstStation] [-h] [--memo states] [--replan command-file] [--resume] [--results results-file] [-H history-file] [-i] [-j processes] [-n] [-o ordering] [-p] [-s time] [--stats stats-file] [--node-limit steps] [--time-limit seconds] [--top routes] [--widen beam-step] [-x] [-S] < traintrips.txt
    note: expected input line formats: 
    1. hash sign distance start-station end-station
    2. (often on 4 separate lines) start-time end-time transfers travel-time
-   -b: beam size
+   -a: try all trips to next destinations, not only the first arriving trip
+   -b: beam size (inf: no beam)
+   --different tracks: with --top: minimal number of tracks that each of two routes must have
+      and the other route not (default 5)
    -f: first station: start all routes here
    -h: show help message and exit
+   --memo states: skip routes that reach a station at a time with the same travelled tracks as an
+      earlier route but no longer distance; remember at most this many states (least recently used
+      states are forgotten)
+   --replan command-file: replan during the competition, read commands from command-file (for
+      example /dev/tty), see REPLANHELP
+   --resume: continue the search saved in the file checkpoint, with the same options
+   --results results-file: store the longest route in the SQLite file results-file; skip the search
+      when a search with the same data and options was completed, otherwise start with the longest
+      route of searches with other beam sizes (not used with -H and --replan)
    -H history-file: file with partial journey; like output format:
       startTime endTime waitingTime distance speed startStation endStation
    -i: ignore transfer safety times
+   -j: number of parallel search processes (not used with -H)
    -n: create new route/delete old route information
-   -s: start time of search, format: HH:MM (hours and minutes)
+   -o ordering: order of next destinations: speed (default), untravelled or gain
+   -p: with -j: divide first trips with the same start station and time over processes
+   -s: start time of search, format: HH:MM (hours and minutes, 00:00 to 23:59)
+   --stats stats-file: write search statistics in JSON format to stats-file, during and after
+      the search
+   --node-limit steps: stop the search after this many search steps (with -j: per process)
+   --time-limit seconds: stop the search after this many seconds
+   --top routes: do not show every longer route but, every ten minutes and at the end of the
+      search, the longest routes that are different enough (see --different); not used with
+      --replan
+   --widen beam-step: search with beam size 0 first, then increase the beam size with beam-step
+      up to the -b beam size, while the limits allow it
+   -x: branch and bound: skip routes that cannot become longer than the longest route found or
+   that cannot make the required visits
    -B: block immediate turn back
    -S: show the speeds of the various trips
+   library use: planner = findRoute.RoutePlanner(open("traintrips.txt").read())
+      routes = planner.search("meppel","00:04",20,timeLimit=60), see RoutePlanner
    20170617 erikt(at)xs4all.nl developed for my 2017 kmkampioen participation
 """
 
+import bisect
+import contextlib
+import copy
 import getopt
+import hashlib
+import heapq
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
 import re
+import sqlite3
 import sys
+import threading
+import time
+import traintrips
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import accumulate
+from multiprocessing import shared_memory
+from operator import length_hint
 
 # constants
-COMMAND = sys.argv.pop(0)
-TIMEZERO = "00:00" # start time of competition
-DAYTIME = "23:59" # duration of competition
-MAXWAIT = "02:00" # do not stay at any station longer than this
-MINRETURNWAITINGTIME = "00:01" # need at least 2 minutes to catch train back
+COMMAND = sys.argv[0]
+# note: all times are stored internally as minutes since 00:00 of the competition day
+TIMEZERO = 0 # start time of competition
+DAYTIME = 23*60+59 # duration of competition
+MAXWAIT = 2*60 # do not stay at any station longer than this
+MINRETURNWAITINGTIME = 1 # need at least 2 minutes to catch train back
 CANTRAVELBACK = "can_travel_back" # stations that can be visited in 2 directions
-CENTERNAME = "zwolle" # visit this station...
-CENTERSTARTTIME = "11:00" # between this time and...
-CENTERENDTIME = "15:00" # this time and...
-CENTERWAITTIME = "00:05" # stay there at least this many minutes
-MAXTIMERESERVE = "00:00" # number of last minute(s) of 24 hours as reserve
+REQUIREDVISITSFILE = "required_visits" # stations that routes must visit in a time window
+MAXTIMERESERVE = 0 # number of last minute(s) of 24 hours as reserve
 MINUTESPERHOUR = 60.0
 NEXTDESTINATIONS = "next_destinations"
 PARTNERFILE="partners" # tracks with overlapping parts
 STATIONSFILE="stations" # list of station names
 TRANSFERSFILE="transfers" # minimum required time per transfer
-TIMEDISTANCEFILE = "time-distance" # best distance covered per time of earlier runs
-TIMEDISTANCEMAXPLUSONE = "26:01"
-HELP="""usage: findRoute.py [-b beam-size] [-f firstStation] [-h] [-H history-file] [-i] [-n] [-s time] [-S] < traintrips.txt
--b: beam size
+TIMEDISTANCEFILE = "time-distance" # best distance covered per time of earlier runs (text export)
+TIMEDISTANCETABLEFILE = "time-distance.bin" # binary version of the time-distance file
+TIMEDISTANCETABLEHEADER = "kmtrein-time-distance"
+TIMEDISTANCEMAXPLUSONE = 26*60+1
+NOROUTE = -1.0 # time-distance value for times without known routes
+INDEXCACHEDIR = "index-cache" # train trips and indexes of earlier runs, per content hash
+INDEXCACHEVERSION = 3 # change when the cached data change
+CHECKPOINTFILE = "checkpoint" # state of the search, for continuing after an interruption
+CHECKPOINTHEADER = "kmtrein-checkpoint"
+CHECKPOINTINTERVAL = 10*60 # seconds between checkpoints
+CHECKPOINTNODES = 10000 # number of search steps between checks of the checkpoint time
+UPPERBOUNDSSTEP = 30 # maximum end times of the upper bounds are rounded up to a multiple of this
+UPPERBOUNDSCACHESIZE = 8 # maximum number of upper bounds tables kept in memory
+STATSINTERVAL = 60 # seconds between writing the statistics file during the search
+TOPINTERVAL = 10*60 # seconds between showing the longest diverse routes during the search
+MINDIFFERENTTRACKS = 5 # default number of tracks that make routes different (--different)
+REPLANBUDGET = 10.0 # default number of seconds for a search in replanning mode
+# longest route per schedule (hash of the data files), first station ("": all stations), start
+# time, beam size and the other options that change the search (see resultsFlags)
+RESULTSTABLE = "create table if not exists results (schedule text, station text, startTime text, beamSize real, flags text, distance real, route text, complete integer, steps integer, seconds real, seed real, primary key (schedule, station, startTime, beamSize, flags))"
+# options that do not change the search or are stored separately in the results file
+RESULTSIGNOREDOPTIONS = ["-b","-f","-h","-j","-n","-s","-S","--different","--memo","--node-limit","--results","--stats","--time-limit","--top"]
+OPTIONS = "ab:f:hH:ij:no:ps:xBS"
+# module variables of a loaded network: the data files, the train trips, the index and the
+# time-distance data; a RoutePlanner keeps its own values, a search gets them from its network
+NETWORKVARIABLES = ["stations","stationNames","trackIds","trackStations","trainTrips","connections","index",
+                    "transfers","next_destinations","partners","can_travel_back","trackBits","trackMasks",
+                    "undirectedBits","partnerMasks","coveredDistances","requiredVisits","requiredVisitsAt",
+                    "requiredVisitBits","latestArrivals","timeDistance","timeDistanceRows","timeDistanceWidth",
+                    "upperBoundsCache","indexStats","ignoreTransferSafetyTimes","globalStartTime"]
+LONGOPTIONS = ["different=","memo=","node-limit=","replan=","results=","resume","stats=","time-limit=","top=","widen="]
+# orderings of next destinations: speed is fixed per index entry, the others depend on the route
+ORDERINGS = ["speed","untravelled","gain"]
+# reasons for not extending a route: too late, turning back too quickly, no new distance after
+# a trip without new distance, required visit not made, required visit out of reach, outside
+# the beam, branch and bound, state reached earlier (--memo)
+PRUNEREASONS = ["maxTime","turnBack","noDistance","visit","visitOutOfReach","beam","bound","memo"]
+HELP="""usage: findRoute.py [-a] [-b beam-size] [--different tracks] [-f firstStation] [-h] [--memo states] [--replan command-file] [--resume] [--results results-file] [-H history-file] [-i] [-j processes] [-n] [-o ordering] [-p] [-s time] [--stats stats-file] [--node-limit steps] [--time-limit seconds] [--top routes] [--widen beam-step] [-x] [-S] < traintrips.txt
+-a: try all trips to next destinations, not only the first arriving trip
+-b: beam size (inf: no beam)
+--different tracks: with --top: minimal number of tracks that each of two routes must have
+   and the other route not (default 5)
 -f: first station: start all routes here
 -h: show help message and exit
+--memo states: skip routes that reach a station at a time with the same travelled tracks as an
+   earlier route but no longer distance; remember at most this many states (least recently used
+   states are forgotten)
+--replan command-file: replan during the competition, read commands from command-file (for
+   example /dev/tty); command help is shown after reading the train trips
+--resume: continue the search saved in the file checkpoint, with the same options
+--results results-file: store the longest route in the SQLite file results-file; skip the search
+   when a search with the same data and options was completed, otherwise start with the longest
+   route of searches with other beam sizes (not used with -H and --replan)
 -H history-file: file with partial journey; like output format:
    startTime endTime waitingTime distance speed startStation endStation
 -i: ignore transfer safety times
+-j: number of parallel search processes (not used with -H)
 -n: create new route/delete old route information
--s: start time of search, format: HH:MM (hours and minutes)
+-o ordering: order of next destinations: speed (default), untravelled or gain
+-p: with -j: divide first trips with the same start station and time over processes
+-s: start time of search, format: HH:MM (hours and minutes, 00:00 to 23:59)
+--stats stats-file: write search statistics in JSON format to stats-file, during and after
+   the search
+--node-limit steps: stop the search after this many search steps (with -j: per process)
+--time-limit seconds: stop the search after this many seconds
+--top routes: do not show every longer route but, every ten minutes and at the end of the
+   search, the longest routes that are different enough (see --different); not used with
+   --replan
+--widen beam-step: search with beam size 0 first, then increase the beam size with beam-step
+   up to the -b beam size, while the limits allow it
+-x: branch and bound: skip routes that cannot become longer than the longest route found or
+   that cannot make the required visits
 -B: block immediate turn back
 -S: show the speeds of the various trips"""
+REPLANHELP="""# commands:
+# route history-file: read the route so far (format: see -H)
+# at station HH:MM: the route so far ends at station at this time, for example after a delay
+# add start-station end-station HH:MM HH:MM: add a train trip to the schedule
+# cancel start-station end-station HH:MM HH:MM: remove a train trip from the schedule
+# transfer HH:MM station station station station [HH:MM]: set a transfer time (format: see transfers)
+# search [seconds]: print the longest continuation of the route found within the time (default 10)
+# quit: stop"""
 
-# variables modifiable by arguments 
-beamSize = 20
-block_turning_back = False
+# variables modifiable by arguments (the options of the search are in SearchState)
 historyFile = ""
-firstStation = ""
-globalStartTime = TIMEZERO # start the journey at this time (or a little bit later)
+globalStartTime = TIMEZERO # start the journey at this time (or a little bit later), for the index
 doShowSpeeds = False
 resetBestDistances = False
 ignoreTransferSafetyTimes = False
+nbrOfProcesses = 1
+splitStartTrips = False
+replanFile = "" # read replanning commands from this file
+resultsFile = "" # store the longest routes in this SQLite file
 # internal variables
 index = {}
 can_travel_back = {}
 connections = {}
 next_destinations = {}
 partners = {}
-stations = {}
+# travelled tracks are stored as bitsets (Python ints) with one bit per track id
+trackBits = [] # track id -> bit of the track
+trackMasks = [] # track id -> bits to set when the track is travelled (track and its reverse)
+undirectedBits = 0 # the bits of the tracks with an even id: one bit per pair of reverse tracks
+partnerMasks = [] # track id -> bits of the tracks that share a section with the track
+coveredDistances = [] # track id -> {travelled partner bits: distance newly covered by the track}
+# required visits are stored as bitsets (Python ints) of made visits with one bit per visit
+requiredVisits = [] # visit number -> (station id, first time, last time, minimal waiting time)
+requiredVisitsAt = {} # station id -> list of (visit bit, first time, last time, minimal waiting time)
+requiredVisitBits = [] # time -> bits of the visits that a route ending at this time must have made
+latestArrivals = {} # station id -> list of (visit bit, latest arrival time for still making the visit)
+stations = {} # station name -> station id
+stationNames = [] # station id -> station name
+trackIds = {} # (start station id, end station id) -> track id
+trackStations = [] # track id -> (start station id, end station id)
 transfers = {}
-trainTrips = []
-maxDistance = 0
-timeDistance = {}
+trainTrips = {}
+# best distance per start station, start time and time: a dense table with one row per start
+# station and start time; in parallel searches the table is stored in shared memory
+timeDistance = array("d")
+timeDistanceRows = {} # (start station id, start time) -> row number
+timeDistanceWidth = TIMEDISTANCEMAXPLUSONE # length of a row: one value per minute
+upperBoundsCache = OrderedDict() # rounded maximum end time -> upper bounds per index key, in order of last use
+# index from the cache or not, and the number of trips that makeIndex skipped for transfer times
+indexStats = {"cached":False,"transferSkippedTrips":0}
+timings = {} # seconds spent on reading the data and building the index
+parallelState = None # the search state of a parallel search, for the worker processes
+# initial values of the variables of a network, for RoutePlanner
+initialVariables = copy.deepcopy({ name:globals()[name] for name in NETWORKVARIABLES })
+plannerLock = threading.Lock() # RoutePlanner: one network in the module variables at a time
+# a trip of a route found by RoutePlanner.search: station names and times in minutes
+RouteTrip = namedtuple("RouteTrip",["startStation","endStation","startTime","endTime","waitingTime","distance","averageSpeed"])
+Route = namedtuple("Route",["distance","trips"])
+
+# the options and the state of a search. findRoute and the functions that it calls get the
+# search state as an argument and take the network data (see NETWORKVARIABLES) from its
+# network: the module variables for the program, the network of a RoutePlanner for its searches
+class SearchState:
+    def __init__(self,network):
+        self.network = network
+        # options
+        self.beamSize = 20
+        self.firstStation = "" # start all routes here, "": all stations
+        self.globalStartTime = TIMEZERO # start the journey at this time (or a little bit later)
+        self.allDepartures = False
+        self.block_turning_back = False
+        self.branchAndBound = False
+        self.ordering = "speed" # order of the next destinations in the search, see ORDERINGS
+        self.timeLimit = None # maximum number of seconds of the search
+        self.nodeLimit = None # maximum number of search steps
+        self.beamWidening = None # increase of the beam size per search of a widening search
+        self.statsFile = "" # write search statistics to this file
+        self.topSize = 0 # number of diverse routes to show, 0: show every longer route
+        self.minDifferentTracks = MINDIFFERENTTRACKS # number of tracks that make routes different
+        self.memoSize = 0 # maximum number of search states in the transposition table, 0: no table
+        self.searchOptions = [] # command line options, saved in checkpoints
+        # state
+        self.maxDistance = 0
+        self.maxTime = TIMEZERO+DAYTIME # routes end before this time, see computeMaxTime
+        self.routeCollector = None # list of (distance, route report, RouteTrips) of the routes found by worker processes and planners
+        self.topRoutes = [] # heap of (distance, undirected travelled tracks, route report, RouteTrips) of the longest diverse routes
+        self.topChanged = False # topRoutes changed since they were last shown
+        self.nextTopTime = 0 # time for showing topRoutes during the search
+        self.bestRoute = "" # report of the longest route found
+        self.checkpoint = None # state of an interrupted search, read by --resume
+        self.currentRoot = 0 # number of the start trip (root) being searched
+        self.nextCheckpointTime = time.time()+CHECKPOINTINTERVAL
+        self.sharedMaxDistance = None # longest distance found by the processes of a parallel search, in shared memory
+        self.parallelStartDistance = 0 # longest distance at the start of a parallel search
+        # transposition table: search state -> longest distance of the routes that reached it, in
+        # order of last use
+        self.memoTable = OrderedDict()
+        self.deadline = None # time at which the search stops (anytime search), None for no limit
+        # number of search steps, reason for stopping the search and times of the first and the
+        # last longest route found
+        self.searchStats = {"steps":0,"stopped":None,"firstRouteTime":None,"bestRouteTime":None}
+        # counts of the search for the statistics file: routes (nodes) per number of trips, reasons
+        # for not extending a route (see PRUNEREASONS) and partner track overlaps; only counted
+        # with statsFile
+        self.searchCounts = {"nodesPerDepth":[],"pruned":{ reason:0 for reason in PRUNEREASONS },"partnerOverlaps":0,"partnerDeduction":0.0}
+        self.nextStatsTime = 0 # time for writing the statistics file during the search
 
 def help():
     print(HELP)
     sys.exit()
 
+# tracks are registered in pairs: a track and its reverse only differ in the lowest bit
 def reverseTrack(track):
-    startStation,endStation = track.split()
-    return(endStation+" "+startStation)
+    return(track^1)
+
+# get the id of the track between two station ids, register it if it is new
+def getTrack(startStation,endStation):
+    if not (startStation,endStation) in trackIds:
+        trackIds[(startStation,endStation)] = len(trackStations)
+        trackStations.append((startStation,endStation))
+        trackIds[(endStation,startStation)] = len(trackStations)
+        trackStations.append((endStation,startStation))
+    return(trackIds[(startStation,endStation)])
+
+# bits to set in the travelled bitset when a track has been travelled
+def trackMask(track):
+    if track in can_travel_back: return(1<<track)
+    else: return((1<<track)|(1<<reverseTrack(track)))
+
+# precompute the bitset masks of all tracks; requires the partners and can_travel_back data
+def makeTrackMasks():
+    global trackBits,trackMasks,partnerMasks,coveredDistances,undirectedBits
+
+    trackBits = [ 1<<track for track in range(0,len(trackStations)) ]
+    undirectedBits = sum(trackBits[0::2])
+    trackMasks = [ trackMask(track) for track in range(0,len(trackStations)) ]
+    partnerMasks = [ 0 for track in range(0,len(trackStations)) ]
+    for track in partners:
+        for partner,partnerDistance in partners[track]: partnerMasks[track] |= trackBits[partner]
+    coveredDistances = [ {} for track in range(0,len(trackStations)) ]
+
+# distance newly covered by a track of a certain length given the travelled partner tracks (overlap)
+# note: results are cached per track: all trips on a track have the same length
+def coveredDistance(network,track,distance,overlap):
+    coveredDistances = network["coveredDistances"][track]
+    if not overlap in coveredDistances:
+        trackBits = network["trackBits"]
+        for partner,partnerDistance in network["partners"][track]:
+            if overlap & trackBits[partner]: distance -= partnerDistance
+        coveredDistances[overlap] = distance
+    return(coveredDistances[overlap])
+
+def trackName(track):
+    startStation,endStation = trackStations[track]
+    return(stationNames[startStation]+" "+stationNames[endStation])
 
 def readStations():
     try: inFile = open(STATIONSFILE,"r")
@@ -88,7 +321,7 @@ def readStations():
     stations = {}
     for line in inFile:
         line = line.rstrip()
-        stations[line] = True
+        if not line in stations: stations[line] = len(stations)
     return(stations)
 
 # read minimal transfer times
@@ -100,215 +333,580 @@ def readTransfers():
         line = line.rstrip()
         fields = line.split()
         if len(fields) < 5: sys.exit(COMMAND+": unexpected line in file "+TRANSFERSFILE+": "+line+"\n")
-        time = fields.pop(0)
+        time = time2minutes(fields.pop(0))
         for i in range(0,4):
             if not fields[i] in stations:
                 sys.exit(COMMAND+": unknown station "+fields[i]+" on line: "+line+"\n")
-        line = " ".join(fields)
-        transfers[line] = time
+        trackPair = (getTrack(stations[fields[0]],stations[fields[1]]),getTrack(stations[fields[2]],stations[fields[3]]))
+        # optional fifth field: arrival time at the transfer station
+        if len(fields) > 4: transfers[trackPair+(time2minutes(fields[4]),)] = time
+        else: transfers[trackPair] = time
     return(transfers)
 
-# read time-distance file
+# get the row of the time-distance table of a start station and start time, add it if it is new
+def timeDistanceRow(network,startStation,startTime):
+    timeDistanceRows = network["timeDistanceRows"]
+    if not (startStation,startTime) in timeDistanceRows:
+        timeDistanceRows[(startStation,startTime)] = len(timeDistanceRows)
+        network["timeDistance"].extend([NOROUTE]*network["timeDistanceWidth"])
+    return(timeDistanceRows[(startStation,startTime)])
+
+# read time-distance file into the time-distance table
 def readTimeDistance():
-    timeDistance = {}
     try: inFile = open(TIMEDISTANCEFILE,"r")
-    except: return(timeDistance)
+    except: return()
     patternHashStart = re.compile("^#")
     for line in inFile:
         line = line.rstrip()
         if patternHashStart.match(line): continue
         fields = line.split()
-        if len(fields) == 3: return({}) # old format
+        if len(fields) == 3: # old format
+            timeDistanceRows.clear()
+            del timeDistance[:]
+            return()
         if len(fields) != 4: sys.exit(COMMAND+": unexpected line in file "+TIMEDISTANCEFILE+": "+line+"\n")
         station,startTime,time,distance = fields
-        timeDistance[station+" "+startTime+" "+time] = float(distance)
-    return(timeDistance)
+        if not station in stations: sys.exit(COMMAND+": unknown station in file "+TIMEDISTANCEFILE+": "+station+"\n")
+        row = timeDistanceRow(globals(),stations[station],time2minutes(startTime))
+        timeDistance[row*timeDistanceWidth+time2minutes(time)] = float(distance)
 
-# write time-distance file
+# write time-distance file: for each minute the best distance reached at or before that minute
 def writeTimeDistance(timeDistance):
     try: outFile = open(TIMEDISTANCEFILE,"w")
     except: sys.exit(COMMAND+": cannot write file "+TIMEDISTANCEFILE+"\n")
-    startStationsTimes = {}
-    for keyTD in timeDistance:
-        fields = keyTD.split()
-        if len(fields) != 3: sys.exit(COMMAND+": invalid time-distance key: "+keyTD+"\n")
-        station,startTime,time = keyTD.split()
-        startStationsTimes[station+" "+startTime] = True
-    for stationTime in startStationsTimes:
-        lastDistance = 0
-        for minutes in range(0,time2minutes(TIMEDISTANCEMAXPLUSONE)):
-            thisTime = minutes2time(minutes)
-            keyTD = stationTime+" "+thisTime
-            if not keyTD in timeDistance or timeDistance[keyTD] <= lastDistance:
-                outFile.write(keyTD+" "+str(int(lastDistance*10)/10)+"\n")
-            else:
-                outFile.write(keyTD+" "+str(int(timeDistance[keyTD]*10)/10)+"\n")
-                lastDistance = timeDistance[keyTD]
+    for (station,startTime),row in timeDistanceRows.items():
+        base = row*timeDistanceWidth
+        values = timeDistance[base:base+TIMEDISTANCEMAXPLUSONE]
+        # skip rows of start stations that have not been searched yet
+        if max(values) == NOROUTE: continue
+        prefix = stationNames[station]+" "+minutes2time(startTime)+" "
+        bestDistances = accumulate(values,max,initial=0)
+        next(bestDistances)
+        outFile.write("".join([ prefix+minutes2time(minutes)+" "+str(int(bestDistance*10)/10)+"\n" 
+                                for minutes,bestDistance in enumerate(bestDistances) ]))
     outFile.close()
 
+# read the binary time-distance table, return False if it is not available
+# file format: header line, one line per row (station and start time), padding, table of doubles
+def readTimeDistanceTable():
+    try: inFile = open(TIMEDISTANCETABLEFILE,"rb")
+    except: return(False)
+    data = mmap.mmap(inFile.fileno(),0,access=mmap.ACCESS_READ)
+    inFile.close()
+    fields = data.readline().decode().split()
+    if len(fields) != 4 or fields[0] != TIMEDISTANCETABLEHEADER: 
+        sys.exit(COMMAND+": unexpected header in file "+TIMEDISTANCETABLEFILE+"\n")
+    width,nbrOfRows,byteOrder = int(fields[1]),int(fields[2]),fields[3]
+    rows = []
+    for i in range(0,nbrOfRows):
+        station,startTime = data.readline().decode().split()
+        if not station in stations: sys.exit(COMMAND+": unknown station in file "+TIMEDISTANCETABLEFILE+": "+station+"\n")
+        rows.append((stations[station],time2minutes(startTime)))
+    values = array("d")
+    offset = data.tell()+(-data.tell())%values.itemsize
+    values.frombytes(data[offset:offset+nbrOfRows*width*values.itemsize])
+    data.close()
+    if len(values) != nbrOfRows*width: sys.exit(COMMAND+": file "+TIMEDISTANCETABLEFILE+" is incomplete\n")
+    if byteOrder != sys.byteorder: values.byteswap()
+    # copy the rows: the width of the table may have changed since the file was written
+    size = min(width,timeDistanceWidth)
+    for i in range(0,nbrOfRows):
+        base = timeDistanceRow(globals(),rows[i][0],rows[i][1])*timeDistanceWidth
+        timeDistance[base:base+size] = values[i*width:i*width+size]
+    return(True)
+
+# write the binary time-distance table, via a temporary file so that it is never incomplete
+def writeTimeDistanceTable(timeDistance):
+    header = "%s %d %d %s\n" % (TIMEDISTANCETABLEHEADER,timeDistanceWidth,len(timeDistanceRows),sys.byteorder)
+    for station,startTime in timeDistanceRows:
+        header += stationNames[station]+" "+minutes2time(startTime)+"\n"
+    header = header.encode()
+    header += b" "*(-len(header)%8)
+    try: 
+        outFile = open(TIMEDISTANCETABLEFILE+".tmp","wb")
+        outFile.write(header)
+        outFile.write(timeDistance.tobytes())
+        outFile.close()
+        os.replace(TIMEDISTANCETABLEFILE+".tmp",TIMEDISTANCETABLEFILE)
+    except: sys.exit(COMMAND+": cannot write file "+TIMEDISTANCETABLEFILE+"\n")
+
 def averageSpeed(distance,startTime,endTime):
-    averageSpeed = MINUTESPERHOUR*distance/(time2minutes(endTime)-time2minutes(startTime))
+    averageSpeed = MINUTESPERHOUR*distance/(endTime-startTime)
     return(averageSpeed)
 
-def readTrainTrips():
-    # regular expressions
-    patternHashStart = re.compile("^#")
-    patternIsTime = re.compile("^\d\d:\d\d$")
-    patternIsNumber = re.compile("^\d+(\.\d+)?$")
-    # variables
-    trainTrips = []
+def readTrainTrips(inLines):
+    # variables: the train trips are stored column-wise, one array per field
+    trainTrips = {"startStation":array("i"),"endStation":array("i"),"track":array("i"),
+                  "startTime":array("i"),"endTime":array("i"),"distance":array("d"),"averageSpeed":array("d")}
     connections = {}
-    startStation = ""
-    endStation = ""
-    distance = 0
-    lines = [] # contain train trip information (spread over several lines)
-    for line in sys.stdin:
-        line = line.rstrip()
-        # line with route meta data start with a hash sign
-        # example: # 39 amsterdamcentraal utrechtcentraal
-        if patternHashStart.match(line):
-            fields = line.split()
-            # sanity checks
-            if len(fields) != 4: 
-                sys.exit(COMMAND+": unexpected line in data file: "+line+"\n")
-            if not patternIsNumber.match(fields[1]): 
-                sys.exit(COMMAND+": missing distance on line: "+line+"\n")
-            distance = float(fields[1])
-            startStation = fields[2]
-            endStation = fields[3]
+    for record in traintrips.read_trips(inLines):
+        # track line, example: # 39 amsterdamcentraal utrechtcentraal
+        if isinstance(record,traintrips.Track):
+            for station in [record.start_station,record.end_station]:
+                if not station in stations:
+                    sys.exit(COMMAND+": unknown station on stdin: "+station+"\n")
+            startStation = stations[record.start_station]
+            endStation = stations[record.end_station]
+            track = getTrack(startStation,endStation)
+            distance = record.distance
             if startStation not in connections:
                 connections[startStation] = {}
             if endStation not in connections[startStation]:
                 connections[startStation][endStation] = distance
-            for station in fields[2:4]:
-                if not station in stations:
-                    sys.exit(COMMAND+": unknown station on stdin: "+station+"\n")
-            lines = []
         else:
-        # lines with train trip information are grouped in sets of four
-        # 1. start time, 2. end time, 3. number of transfers, 4. travel time
-            fields = line.split()
-            lines.extend(fields)
-            if len(lines) > 4: 
-                sys.exit(COMMAND+": unexpected schedule data (quantity): "+str(lines)+"\n")
-            if len(lines) == 4:
-                startTime = lines[0]
-                endTime = lines[1]
-                if not patternIsTime.match(startTime) or \
-                   not patternIsTime.match(endTime):
-                    sys.exit(COMMAND+": unexpected schedule data (times): "+str(lines)+"\n")
-                # do not allow travelling over the day end
-                if startTime >= endTime:
-                    sys.exit(COMMAND+": unexpected start and end time: "+str(lines)+"\n")
-                speed = averageSpeed(distance,startTime,endTime)
-                trainTrips.append({"startStation":startStation,"endStation":endStation,"startTime":startTime,"endTime":endTime,"distance":distance,"averageSpeed":speed})
-                # clear lines buffer
-                lines = []
+            # do not allow travelling over the day end
+            if record.start_time >= record.end_time:
+                sys.exit(COMMAND+": unexpected start and end time on line "+str(record.line_number)+"\n")
+            trainTrips["startStation"].append(startStation)
+            trainTrips["endStation"].append(endStation)
+            trainTrips["track"].append(track)
+            trainTrips["startTime"].append(record.start_time)
+            trainTrips["endTime"].append(record.end_time)
+            trainTrips["distance"].append(distance)
+            trainTrips["averageSpeed"].append(averageSpeed(distance,record.start_time,record.end_time))
+    sortTrainTrips(trainTrips)
     return trainTrips, connections
 
+# store the trips of each track together, in order of start time, like in traintrips.txt, and
+# add the column nextBetter: the next trip of the same track that arrives earlier, or the first
+# trip of the next track if there is none
+def sortTrainTrips(trainTrips):
+    tracks = trainTrips["track"]
+    startTimes = trainTrips["startTime"]
+    endTimes = trainTrips["endTime"]
+    firstTrips = {}
+    for i in range(0,len(tracks)):
+        if not tracks[i] in firstTrips: firstTrips[tracks[i]] = i
+    order = sorted(range(0,len(tracks)),key=lambda i: (firstTrips[tracks[i]],startTimes[i],i))
+    if order != list(range(0,len(tracks))):
+        for column in trainTrips: trainTrips[column] = array(trainTrips[column].typecode,[ trainTrips[column][i] for i in order ])
+    makeNextBetter(trainTrips)
+
+# compute the column nextBetter of the train trips (see sortTrainTrips)
+def makeNextBetter(trainTrips):
+    tracks = trainTrips["track"]
+    endTimes = trainTrips["endTime"]
+    nextBetter = array("i",[0])*len(tracks)
+    later = [] # later trips of the track that arrive earlier than the trips after them
+    for i in range(len(tracks)-1,-1,-1):
+        if i == len(tracks)-1 or tracks[i] != tracks[i+1]: 
+            later = []
+            end = i+1
+        while len(later) > 0 and endTimes[later[-1]] >= endTimes[i]: later.pop(-1)
+        nextBetter[i] = later[-1] if len(later) > 0 else end
+        later.append(i)
+    trainTrips["nextBetter"] = nextBetter
+
+# key of the index cache: content hash of the data used for building the index and of the
+# options and settings that change it
+def indexCacheKey(trainTripsText):
+    digest = hashlib.sha256()
+    settings = (INDEXCACHEVERSION,globalStartTime,ignoreTransferSafetyTimes,TIMEZERO,MAXWAIT,MINRETURNWAITINGTIME)
+    digest.update((str(settings)+"\n").encode())
+    # missing files are hashed as empty files: the transfers file is optional
+    for fileName in [STATIONSFILE,TRANSFERSFILE,NEXTDESTINATIONS]:
+        try: 
+            inFile = open(fileName,"rb")
+            data = inFile.read()
+            inFile.close()
+        except: data = b""
+        digest.update(b"%d\n" % (len(data)))
+        digest.update(data)
+    digest.update(trainTripsText.encode())
+    return(digest.hexdigest())
+
+# read the train trips, tracks and index stored by writeIndexCache; None if not available
+def readIndexCache(cacheKey):
+    try: 
+        inFile = open(os.path.join(INDEXCACHEDIR,cacheKey),"rb")
+        cache = pickle.load(inFile)
+        inFile.close()
+    except: return(None)
+    return(cache)
+
+# store the train trips, tracks and index for later runs with the same data and options
+def writeIndexCache(cacheKey,cache):
+    fileName = os.path.join(INDEXCACHEDIR,cacheKey)
+    try: 
+        os.makedirs(INDEXCACHEDIR,exist_ok=True)
+        outFile = open(fileName+".tmp","wb")
+        pickle.dump(cache,outFile,protocol=pickle.HIGHEST_PROTOCOL)
+        outFile.close()
+        os.replace(fileName+".tmp",fileName)
+    except: sys.stderr.write(COMMAND+": cannot write file "+fileName+"\n")
+
 def time2minutes(time):
     chars = list(time)
     minutes = 600*int(chars[0])+60*int(chars[1])+10*int(chars[3])+int(chars[4])
     return(minutes)
 
+# the minutes of a start time HH:MM (00:00 to 23:59), None if value is not such a time
+def startTime2minutes(value):
+    if not re.match(r"^([01][0-9]|2[0-3]):[0-5][0-9]$",value): return(None)
+    return(time2minutes(value))
+
 def minutes2time(minutes):
-    hours = int(float(minutes)/MINUTESPERHOUR)
-    minutes = int(minutes-hours*MINUTESPERHOUR)
-    if hours < 10: hours = "0"+str(hours)
-    else: hours = str(hours)
-    if minutes < 10: minutes = "0"+str(minutes)
-    else: minutes = str(minutes)
-    return(hours+":"+minutes)
-
-def computeTimes(startTime,waitingTime):
-    startMinutes = time2minutes(startTime)
-    waitingMinutes = time2minutes(waitingTime)
-    times = []
-    for minutes in range(startMinutes-waitingMinutes,startMinutes+1):
-        if minutes >= 0:
-            time = minutes2time(minutes)
-            if time >= globalStartTime: times.append(time)
-    return(times)
-    
+    hours,minutes = divmod(int(minutes),int(MINUTESPERHOUR))
+    return("%02d:%02d" % (hours,minutes))
+
+# the tracks of the trips leaving from each station: station id -> list of (track id, first trip,
+# last trip + 1); the trips of each track are stored together, in order of start time
+def makeTracksFrom(trainTrips):
+    tracks = trainTrips["track"]
+    startStations = trainTrips["startStation"]
+    tracksFrom = {}
+    for i in range(0,len(tracks)):
+        if i == 0 or tracks[i] != tracks[i-1]:
+            if not startStations[i] in tracksFrom: tracksFrom[startStations[i]] = []
+            tracksFrom[startStations[i]].append([tracks[i],i,i+1])
+        else: tracksFrom[startStations[i]][-1][2] = i+1
+    return(tracksFrom)
+
+# compute the index entry of a station and time (key) and a previous start station: the next
+# destinations with the range of trips that can be taken to them, see makeIndex
+def makeIndexEntry(trainTrips,transfers,tracksFrom,key,prevStartStation):
+    startTimes = trainTrips["startTime"]
+    nextBetter = trainTrips["nextBetter"]
+    startStation,time = key
+    destinations = {}
+    if time < globalStartTime or not startStation in tracksFrom: return(destinations)
+    for track,firstTrip,lastTrip in tracksFrom[startStation]:
+        endStation = trackStations[track][1]
+        first = bisect.bisect_left(startTimes,time,firstTrip,lastTrip)
+        last = bisect.bisect_right(startTimes,time+MAXWAIT,first,lastTrip)
+        if first == last: continue
+        # collect all relevant trips for the start of the route
+        if time == TIMEZERO: 
+            destinations[endStation] = (first,last)
+            continue
+        # for continuing a route, consider the minimal transfer times
+        minimalWaitingTime = 0
+        if not ignoreTransferSafetyTimes:
+            if prevStartStation == endStation: minimalWaitingTime = MINRETURNWAITINGTIME
+            trackPair = (trackIds.get((prevStartStation,startStation)),track)
+            minimalWaitingTime = max(minimalWaitingTime,transfers.get(trackPair,0),transfers.get(trackPair+(time,),0))
+            transferFirst = bisect.bisect_left(startTimes,time+minimalWaitingTime,first,last)
+            indexStats["transferSkippedTrips"] += transferFirst-first
+            first = transferFirst
+        # skip trips for which a later trip arrives earlier
+        while first < last and nextBetter[first] < last: first += 1
+        if first < last: destinations[endStation] = (first,last)
+    # fix the order of the next destinations
+    return(sort_stations(destinations,prevStartStation,startStation))
+
+# the index maps (station id, time) to previous start station to end station to a range of trips
+# (first trip, last trip + 1) of the track to the end station. The first trip is the trip that
+# arrives first among the trips that can be taken; for the start time of the competition the
+# range contains all trips that can be taken, otherwise the other trips that can be taken are
+# the trips of the range that are not followed by a trip of the range that arrives earlier
 def makeIndex(trainTrips,transfers):
     index = {}
+    startStations = trainTrips["startStation"]
+    endStations = trainTrips["endStation"]
+    startTimes = trainTrips["startTime"]
+    endTimes = trainTrips["endTime"]
     # first check at which stations we can be at what times
-    for i in range(0,len(trainTrips)):
-        key = trainTrips[i]["endStation"]+" "+trainTrips[i]["endTime"]
+    for i in range(0,len(startTimes)):
+        key = (endStations[i],endTimes[i])
         # we need follow-up routes for any station a trip finishes at
         if not key in index: index[key] = {}
         # keep the start station as well
-        index[key][trainTrips[i]["startStation"]] = {}
+        index[key][startStations[i]] = {}
         # we need follow-up routes for any station we can start the day
-        if trainTrips[i]["startTime"] <= MAXWAIT:
-            key = trainTrips[i]["endStation"]+" "+globalStartTime
+        if startTimes[i] <= MAXWAIT:
+            key = (endStations[i],globalStartTime)
             if not key in index: index[key] = {}
             # no start station: use the end station as start station
-            index[key][trainTrips[i]["endStation"]] = {}
-    # next look for appropriate places to use a train trip
-    for i in range(0,len(trainTrips)):
-        for time in computeTimes(trainTrips[i]["startTime"],MAXWAIT):
-            startStation = trainTrips[i]["startStation"]
-            key = startStation+" "+time
-            if key in index:
-                for prevStartStation in index[key]:
-                    # we keep only the time closest to now
-                    # ! this causes a problem when the station requires a longer waiting time:
-                    # ! the next time is missing
-                    endStation = trainTrips[i]["endStation"]
-                    trackPair = prevStartStation+" "+startStation+" "+startStation+" "+endStation
-                    trackPairTime = trackPair+" "+time
-                    waitingTime = minutes2time(time2minutes(trainTrips[i]["startTime"])-time2minutes(time)) 
-                    nextTrip = {"startTime":trainTrips[i]["startTime"],"endTime":trainTrips[i]["endTime"],"distance":trainTrips[i]["distance"],"averageSpeed":trainTrips[i]["averageSpeed"]}
-                    # collect all relevant trips for the start of the route
-                    if time == TIMEZERO:
-                        if not endStation in index[key][prevStartStation]: index[key][prevStartStation][endStation] = []
-                        index[key][prevStartStation][endStation].append(nextTrip)
-                    # for continuing a route, just keep the best time for each destination; consider the minimal transfer times
-                    elif (not endStation in index[key][prevStartStation] or \
-                        trainTrips[i]["endTime"] < index[key][prevStartStation][endStation][0]["endTime"]) and \
-                       (prevStartStation != endStation or waitingTime >= MINRETURNWAITINGTIME or ignoreTransferSafetyTimes) and \
-                       (not trackPair in transfers or waitingTime >= transfers[trackPair] or ignoreTransferSafetyTimes) and \
-                       (not trackPairTime in transfers or waitingTime >= transfers[trackPairTime] or ignoreTransferSafetyTimes):
-                        if not endStation in index[key][prevStartStation]: index[key][prevStartStation][endStation] = [nextTrip]
-                        else: index[key][prevStartStation][endStation][0] = nextTrip
+            index[key][endStations[i]] = {}
+    # next look for the trips that can be taken at each station and time
+    tracksFrom = makeTracksFrom(trainTrips)
+    for key in index:
+        for prevStartStation in index[key]:
+            index[key][prevStartStation] = makeIndexEntry(trainTrips,transfers,tracksFrom,key,prevStartStation)
     return(index)
 
-def centerVisited(route):
-    if len(route) == 0: return(True)
-    if route[-1]["endTime"] < CENTERENDTIME or ignoreTransferSafetyTimes: return(True)
+# Changes of the schedule on the day itself (delays, cancelled trains, extra transfer time) can
+# be made without rebuilding the index: the functions below add or remove a trip or set a
+# transfer time and only compute the index entries again that can use the trip or transfer.
+# They return the start keys (start station id, start time) of the time-distance rows that may
+# no longer be correct: the rows of routes that start before the changed trip or transfer
+
+# add the index entry of a station and time (key) and a previous start station if it is missing,
+# for routes that arrive at times which are not in the schedule, for example after a delay
+def addIndexEntry(index,key,prevStartStation):
+    if not key in index: index[key] = {}
+    if not prevStartStation in index[key]:
+        index[key][prevStartStation] = makeIndexEntry(trainTrips,transfers,makeTracksFrom(trainTrips),key,prevStartStation)
+        upperBoundsCache.clear()
+
+# index keys of a station with a time between firstTime and lastTime
+def stationKeys(index,station,firstTime,lastTime):
+    return([ key for key in index if key[0] == station and key[1] >= firstTime and key[1] <= lastTime ])
+
+# compute the index entries of a station between firstTime and lastTime again, for all previous
+# start stations or only for prevStartStation
+def updateIndexEntries(index,station,firstTime,lastTime,prevStartStation=None):
+    tracksFrom = makeTracksFrom(trainTrips)
+    for key in stationKeys(index,station,firstTime,lastTime):
+        for prev in index[key]:
+            if prevStartStation is None or prev == prevStartStation:
+                index[key][prev] = makeIndexEntry(trainTrips,transfers,tracksFrom,key,prev)
+
+# shift the trip ranges in the index after inserting (change 1) or removing (change -1) the trip
+# at position; ranges containing the trip are computed again later
+def renumberTrips(index,position,change):
+    for prevStartStations in index.values():
+        for destinations in prevStartStations.values():
+            for endStation,(first,last) in destinations.items():
+                if last > position:
+                    if first > position or (change > 0 and first == position): first += change
+                    destinations[endStation] = (first,last+change)
+
+# the time-distance start keys of the routes that may use a trip or transfer at time
+def staleStartKeys(time):
+    return(sorted([ key for key in timeDistanceRows if key[1] <= time ]))
+
+# position of the first trip of track between startTime and endTime, or None if there is none
+def findTrip(track,startTime,endTime):
+    startTimes = trainTrips["startTime"]
+    endTimes = trainTrips["endTime"]
+    for thisTrack,first,last in makeTracksFrom(trainTrips).get(trackStations[track][0],[]):
+        if thisTrack != track: continue
+        for i in range(bisect.bisect_left(startTimes,startTime,first,last),last):
+            if startTimes[i] != startTime: break
+            if endTimes[i] == endTime: return(i)
+    return(None)
+
+# add a trip between two station ids to the train trips and the index
+def addTrip(index,startStation,endStation,startTime,endTime):
+    if not (startStation,endStation) in trackIds or not endStation in connections.get(startStation,{}):
+        raise ValueError("unknown track: "+stationNames[startStation]+" "+stationNames[endStation])
+    if startTime >= endTime: 
+        raise ValueError("start time "+minutes2time(startTime)+" not before end time "+minutes2time(endTime))
+    track = trackIds[(startStation,endStation)]
+    distance = connections[startStation][endStation]
+    # store the trip after the trips of the track that start at the same time or earlier
+    position = len(trainTrips["track"])
+    for thisTrack,first,last in makeTracksFrom(trainTrips).get(startStation,[]):
+        if thisTrack == track: position = bisect.bisect_right(trainTrips["startTime"],startTime,first,last)
+    values = {"startStation":startStation,"endStation":endStation,"track":track,"startTime":startTime,"endTime":endTime,
+              "distance":distance,"averageSpeed":averageSpeed(distance,startTime,endTime),"nextBetter":0}
+    for column in trainTrips: trainTrips[column].insert(position,values[column])
+    makeNextBetter(trainTrips)
+    renumberTrips(index,position,1)
+    # the trip may add keys for the station where it ends, see makeIndex
+    tracksFrom = makeTracksFrom(trainTrips)
+    newKeys = [((endStation,endTime),startStation)]
+    if startTime <= MAXWAIT: newKeys.append(((endStation,globalStartTime),endStation))
+    for key,prevStartStation in newKeys:
+        if not key in index: index[key] = {}
+        if not prevStartStation in index[key]:
+            index[key][prevStartStation] = makeIndexEntry(trainTrips,transfers,tracksFrom,key,prevStartStation)
+    updateIndexEntries(index,startStation,startTime-MAXWAIT,startTime)
+    upperBoundsCache.clear()
+    makeVisitTables()
+    return(staleStartKeys(startTime))
+
+# remove a trip between two station ids from the train trips and the index
+def removeTrip(index,startStation,endStation,startTime,endTime):
+    position = None
+    if (startStation,endStation) in trackIds: position = findTrip(trackIds[(startStation,endStation)],startTime,endTime)
+    if position is None:
+        raise ValueError("unknown trip: "+minutes2time(startTime)+" "+minutes2time(endTime)+" "+stationNames[startStation]+" "+stationNames[endStation])
+    for column in trainTrips: del trainTrips[column][position]
+    makeNextBetter(trainTrips)
+    renumberTrips(index,position,-1)
+    # remove the keys of the station where the trip ends that can no longer be reached
+    startStations = trainTrips["startStation"]
+    endStations = trainTrips["endStation"]
+    startTimes = trainTrips["startTime"]
+    endTimes = trainTrips["endTime"]
+    oldKeys = []
+    if not any(endTimes[i] == endTime and startStations[i] == startStation and endStations[i] == endStation for i in range(0,len(endTimes))):
+        oldKeys.append(((endStation,endTime),startStation))
+    if startTime <= MAXWAIT and not any(endStations[i] == endStation and startTimes[i] <= MAXWAIT for i in range(0,len(endTimes))):
+        oldKeys.append(((endStation,globalStartTime),endStation))
+    for key,prevStartStation in oldKeys:
+        if key in index and prevStartStation in index[key]:
+            del index[key][prevStartStation]
+            if len(index[key]) == 0: del index[key]
+    updateIndexEntries(index,startStation,startTime-MAXWAIT,startTime)
+    upperBoundsCache.clear()
+    makeVisitTables()
+    return(staleStartKeys(startTime))
+
+# set the minimal transfer time of a pair of track ids, optionally followed by the arrival time
+# at the transfer station (see readTransfers); waitingTime None removes the transfer time
+def setTransfer(index,trackPair,waitingTime):
+    if waitingTime is None: transfers.pop(trackPair,None)
+    else: transfers[trackPair] = waitingTime
+    prevStartStation,station = trackStations[trackPair[0]]
+    if len(trackPair) > 2: firstTime,lastTime = trackPair[2],trackPair[2]
+    else: firstTime,lastTime = TIMEZERO,max([ key[1] for key in index ]+[TIMEZERO])
+    updateIndexEntries(index,station,firstTime,lastTime,prevStartStation)
+    upperBoundsCache.clear()
+    return(staleStartKeys(lastTime))
+
+# read the required visits: station, first time, last time and minimal waiting time. A route
+# makes a visit when it waits at the station at least the minimal waiting time and arrives or
+# leaves between the first and the last time. Routes that end at or after the last time must
+# have made the visit
+def readRequiredVisits():
+    requiredVisits = []
+    try: inFile = open(REQUIREDVISITSFILE,"r")
+    except: return(requiredVisits)
+    for line in inFile:
+        line = line.rstrip()
+        fields = line.split()
+        if len(fields) != 4: sys.exit(COMMAND+": unexpected line in file "+REQUIREDVISITSFILE+": "+line+"\n")
+        if not fields[0] in stations: sys.exit(COMMAND+": unknown station "+fields[0]+" on line: "+line+"\n")
+        requiredVisits.append((stations[fields[0]],time2minutes(fields[1]),time2minutes(fields[2]),time2minutes(fields[3])))
+    inFile.close()
+    return(requiredVisits)
+
+# precompute the tables of the required visits: the visits per station, the visits required
+# per route end time and the latest arrival time per station for still making each visit, based
+# on the shortest trip of each track; like the transfer times, -i ignores the required visits
+def makeVisitTables():
+    global requiredVisitsAt,requiredVisitBits,latestArrivals
+
+    visits = [] if ignoreTransferSafetyTimes else requiredVisits
+    requiredVisitsAt = {}
+    requiredVisitBits = [0]*timeDistanceWidth
+    for i,(station,firstTime,lastTime,waitingTime) in enumerate(visits):
+        if not station in requiredVisitsAt: requiredVisitsAt[station] = []
+        requiredVisitsAt[station].append((1<<i,firstTime,lastTime,waitingTime))
+        for time in range(lastTime,timeDistanceWidth): requiredVisitBits[time] |= 1<<i
+    shortestTrips = {} # track id -> duration of the shortest trip
+    for track,startTime,endTime in zip(trainTrips["track"],trainTrips["startTime"],trainTrips["endTime"]):
+        if not track in shortestTrips or endTime-startTime < shortestTrips[track]: shortestTrips[track] = endTime-startTime
+    latestArrivals = {}
+    for i,(station,firstTime,lastTime,waitingTime) in enumerate(visits):
+        # shortest travel times to the station of the visit
+        travelTimes = {station:0}
+        queue = [(0,station)]
+        while len(queue) > 0:
+            travelTime,endStation = heapq.heappop(queue)
+            if travelTime > travelTimes[endStation]: continue
+            for track,duration in shortestTrips.items():
+                startStation = trackStations[track][0]
+                if trackStations[track][1] == endStation and travelTime+duration < travelTimes.get(startStation,travelTime+duration+1):
+                    travelTimes[startStation] = travelTime+duration
+                    heapq.heappush(queue,(travelTime+duration,startStation))
+        for startStation,travelTime in travelTimes.items():
+            if not startStation in latestArrivals: latestArrivals[startStation] = []
+            latestArrivals[startStation].append((1<<i,lastTime-travelTime))
+
+# bits of the required visits made at a station by arriving at arrivalTime and leaving at
+# departureTime after waitingTime minutes
+def visitBits(network,station,arrivalTime,departureTime,waitingTime):
+    bits = 0
+    for bit,firstTime,lastTime,minimalWaitingTime in network["requiredVisitsAt"].get(station,()):
+        if waitingTime >= minimalWaitingTime and \
+           ((departureTime >= firstTime and departureTime <= lastTime) or (arrivalTime >= firstTime and arrivalTime <= lastTime)):
+            bits |= bit
+    return(bits)
+
+# bits of the required visits made by a route; the start of the route is not a visit
+def routeVisits(network,route):
+    bits = 0
     for i in range(1,len(route)):
-        # did we arrive at the center station in the time frame, waitin 5 mins
-        if route[i]["startStation"] == CENTERNAME and route[i]["waitingTime"] >= CENTERWAITTIME and \
-           ((route[i]["startTime"] >= CENTERSTARTTIME and route[i]["startTime"] <= CENTERENDTIME) or
-            (route[i-1]["endTime"] >= CENTERSTARTTIME and route[i-1]["endTime"] <= CENTERENDTIME)): return(True)
+        bits |= visitBits(network,route[i]["startStation"],route[i-1]["endTime"],route[i]["startTime"],route[i]["waitingTime"])
+    return(bits)
+
+# check if a route that is at a station at a time can no longer make a required visit
+def visitOutOfReach(network,visits,station,time):
+    for bit,latestArrival in network["latestArrivals"].get(station,()):
+        if time > latestArrival and not visits & bit: return(True)
     return(False)
 
-def printRoute(route):
+def formatRoute(network,route):
+    stationNames = network["stationNames"]
+    lines = []
     for trainTrip in route:
-        print("%s %s %s %0.1f %0.1f %d %s %s" % (trainTrip["startTime"],trainTrip["endTime"],trainTrip["waitingTime"],trainTrip["distance"],trainTrip["lessThanBest"],int(trainTrip["averageSpeed"]),trainTrip["startStation"],trainTrip["endStation"]))
+        lines.append("%s %s %s %0.1f %0.1f %d %s %s\n" % (minutes2time(trainTrip["startTime"]),minutes2time(trainTrip["endTime"]),minutes2time(trainTrip["waitingTime"]),trainTrip["distance"],trainTrip["lessThanBest"],int(trainTrip["averageSpeed"]),stationNames[trainTrip["startStation"]],stationNames[trainTrip["endStation"]]))
+    return("".join(lines))
 
-# compute the maximum (end) time for a given start time
-def computeMaxTime(startTime):
-    minutes = time2minutes(startTime)+time2minutes(DAYTIME)
-    if not ignoreTransferSafetyTimes: minutes -= time2minutes(MAXTIMERESERVE)
-    return(minutes2time(minutes))
+# the trips of a route as RouteTrips, for the RoutePlanner
+def routeTrips(network,route):
+    stationNames = network["stationNames"]
+    return([ RouteTrip(stationNames[trainTrip["startStation"]],stationNames[trainTrip["endStation"]],trainTrip["startTime"],
+                       trainTrip["endTime"],trainTrip["waitingTime"],trainTrip["distance"],trainTrip["averageSpeed"]) for trainTrip in route ])
+
+# report a new longest route: print it or, in a worker process or a RoutePlanner, collect it with
+# its trips
+def reportRoute(state,route,distance):
+    text = formatRoute(state.network,route)+"# largest distance : %0.1f\n" % (distance)
+    if state.routeCollector is None: 
+        # with topSize the routes are shown by showTopRoutes
+        if state.topSize == 0: sys.stdout.write(text)
+        state.bestRoute = text
+        noteRouteTime(state)
+    else: state.routeCollector.append((distance,text,routeTrips(state.network,route)))
+
+# the tracks of a travelled bitset without direction: one bit per pair of reverse tracks
+def undirectedTracks(network,travelled):
+    return((travelled|travelled>>1) & network["undirectedBits"])
 
-def fillTimeDistance(startStation,startTime,endTime,distance):
-    global timeDistance
+# routes are different when each has at least minDifferentTracks tracks that the other does not have
+def differentRoutes(state,tracks,otherTracks):
+    return(bin(tracks & ~otherTracks).count("1") >= state.minDifferentTracks and \
+           bin(otherTracks & ~tracks).count("1") >= state.minDifferentTracks)
 
-    for minutes in range(0,time2minutes(TIMEDISTANCEMAXPLUSONE)):
-        thisTime = minutes2time(minutes)
-        if thisTime > endTime:
-            keyTD = startStation+" "+startTime+" "+thisTime
-            if not keyTD in timeDistance or timeDistance[keyTD] <= distance: timeDistance[keyTD] = distance
-            else: return()
+# keep a route in topRoutes if it is among the topSize longest routes that are different from
+# all longer routes; it replaces the shorter routes that are not different from it. The route
+# is a list of trips or, from a worker process, a route report and its RouteTrips
+def collectRoute(state,route,distance,tracks):
+    topRoutes = state.topRoutes
+    if len(topRoutes) >= state.topSize and distance <= topRoutes[0][0]: return()
+    similarRoutes = []
+    for topRoute in topRoutes:
+        if not differentRoutes(state,tracks,topRoute[1]):
+            if topRoute[0] >= distance: return()
+            similarRoutes.append(topRoute)
+    if len(similarRoutes) > 0:
+        topRoutes[:] = [ topRoute for topRoute in topRoutes if not topRoute in similarRoutes ]
+        heapq.heapify(topRoutes)
+    if isinstance(route,tuple): report,trips = route
+    else: report,trips = formatRoute(state.network,route),routeTrips(state.network,route)
+    heapq.heappush(topRoutes,(distance,tracks,report,trips))
+    if len(topRoutes) > state.topSize: heapq.heappop(topRoutes)
+    state.topChanged = True
 
+# show the routes of topRoutes, the longest last
+def showTopRoutes(state):
+    routes = sorted(state.topRoutes)
+    for i,(distance,tracks,route,trips) in enumerate(routes):
+        if i < len(routes)-1: sys.stdout.write(route+"# alternative distance : %0.1f\n" % (distance))
+        else: sys.stdout.write(route+"# largest distance : %0.1f\n" % (distance))
+    sys.stdout.flush()
+    state.topChanged = False
+    state.nextTopTime = time.time()+TOPINTERVAL
 
+# compute the maximum (end) time for a given start time
+def computeMaxTime(network,startTime):
+    minutes = startTime+DAYTIME
+    if not network["ignoreTransferSafetyTimes"]: minutes -= MAXTIMERESERVE
+    return(minutes)
+
+# store distance as best distance for all later times in the time-distance row starting at base
+# up to the first time with a larger distance; the rows are running maxima (non-decreasing),
+# so that time can be found with a binary search and the values can be set with one slice
+# note: in parallel searches other processes may update the same row: this is a monotone update
+# without locks, a concurrent update may occasionally be lost, which only weakens the pruning
+def fillTimeDistance(network,base,endTime,distance):
+    timeDistance = network["timeDistance"]
+    first = base+endTime+1
+    last = bisect.bisect_right(timeDistance,distance,first,base+TIMEDISTANCEMAXPLUSONE)
+    if last > first: timeDistance[first:last] = array("d",[distance])*(last-first)
+
+
+# order next destinations: preferred next destinations first, then by average speed of the
+# first trip, and the station we came from last
 def sort_stations(stations, previous_station, current_station):
     if len(stations) < 2:
         return stations
-    track = " ".join([previous_station, current_station])
+    track = trackIds.get((previous_station, current_station))
     preferred_stations = []
     if track in next_destinations:
         preferred_stations = [ station for station in stations if station in next_destinations[track] ]
@@ -316,108 +914,489 @@ def sort_stations(stations, previous_station, current_station):
     if previous_station in stations:
         sorted_stations = [ previous_station ]
     sorted_stations = sorted([ station for station in stations if station not in preferred_stations and station != previous_station], 
-                               key=lambda x: stations[x][0]["averageSpeed"], reverse=True) + sorted_stations
-    sorted_stations = sorted(preferred_stations, key=lambda x: stations[x][0]["averageSpeed"], reverse=True) + sorted_stations
-    return stations
-
-
-def findRoute(index,route,travelled,distance):
-    global maxDistance,maxTime,timeDistance
-
-    if distance > 0:
-        keyTD = route[0]["startStation"]+" "+route[0]["startTime"]+" "+route[-1]["endTime"]
-        if keyTD not in timeDistance or timeDistance[keyTD] < distance:
-            timeDistance[keyTD] = distance
-            fillTimeDistance(route[0]["startStation"],route[0]["startTime"],route[-1]["endTime"],distance)
-            route[-1]["lessThanBest"] = 0.0
-        if distance >= maxDistance: 
-            maxDistance = distance
-            printRoute(route)
-            print("# largest distance : %0.1f" % (maxDistance))
+                               key=lambda x: trainTrips["averageSpeed"][stations[x][0]], reverse=True) + sorted_stations
+    sorted_stations = sorted(preferred_stations, key=lambda x: trainTrips["averageSpeed"][stations[x][0]], reverse=True) + sorted_stations
+    return { station: stations[station] for station in sorted_stations }
+
+# distance newly covered by a trip after the tracks in travelled
+def tripGain(state,trip,travelled):
+    network = state.network
+    track = network["trainTrips"]["track"][trip]
+    if travelled & network["trackBits"][track]: return(0.0)
+    distance = network["trainTrips"]["distance"][trip]
+    if state.ordering == "gain":
+        overlap = travelled & network["partnerMasks"][track]
+        if overlap: distance = coveredDistance(network,track,distance,overlap)
+    return(distance)
+
+# reorder next destinations for the route so far: untravelled orders by the distance of
+# untravelled trips, gain also subtracts sections shared with travelled partner tracks;
+# preferred next destinations stay first and the station we came from stays last
+def orderStations(state, stations, previous_station, current_station, travelled):
+    if len(stations) < 2:
+        return stations
+    network = state.network
+    preferred_stations = network["next_destinations"].get(network["trackIds"].get((previous_station, current_station)),[])
+    def rank(station):
+        if station in preferred_stations: group = 0
+        elif station == previous_station: group = 2
+        else: group = 1
+        return((group,-tripGain(state,stations[station][0],travelled)))
+    return sorted(stations, key=rank)
+
+
+# the state of a route for the transposition table: everything that determines which trips can
+# follow and how much distance they add: the last trip (its stations, its end time and whether it
+# added distance), the travelled tracks, the required visits made and the maximum end time
+def memoState(state,last,travelled,visits):
+    return((last["endStation"],last["startStation"],last["endTime"],last["distance"] > 0.0,travelled,visits,state.maxTime))
+
+# search the longest routes that continue route, depth first. The search is iterative: a stack
+# holds a frame for each route end that is being extended, with an iterator over the next
+# destinations and the data needed to remove the last trip of the route when the frame is done.
+# With frames (from a checkpoint), the stack is rebuilt and the search continues where it was
+def findRoute(state,index,route,travelled,distance,frames=None):
+    network = state.network
+    searchStats = state.searchStats
+    checkpoint = state.checkpoint
+
     # start of route: check all stations at start time
     if len(route) == 0:
-        for key in index:
-            fields = key.split()
-            if len(fields) < 2: 
-                sys.exit(COMMAND+": incorrect key in index: "+key+"\n")
-            startStation = fields[0]
-            if fields[1] == globalStartTime and (firstStation == "" or startStation == firstStation):
-                for endStation in index[key][startStation]:
-                    for i in range(0,len(index[key][startStation][endStation])):
-                        startTime = index[key][startStation][endStation][i]["startTime"]
-                        if globalStartTime == TIMEZERO or startTime == globalStartTime:
-                            endTime = index[key][startStation][endStation][i]["endTime"]
-                            distance = index[key][startStation][endStation][i]["distance"]
-                            averageSpeed = index[key][startStation][endStation][i]["averageSpeed"]
-                            waitingTime = minutes2time(time2minutes(startTime)-time2minutes("00:00"))
-                            maxTime = computeMaxTime(startTime)
-                            track = startStation+" "+endStation
-                            if track in can_travel_back:
-                                travelled = {track:True}
-                            else:
-                                travelled = {track:True,reverseTrack(track):True}
-                            findRoute(index,[{"startStation":startStation,"endStation":endStation,"startTime":startTime,"endTime":endTime,"distance":distance,"averageSpeed":averageSpeed,"waitingTime":waitingTime,"lessThanBest":0.0}],travelled,distance)
-                    # store new time-distance data for this start station
-                    writeTimeDistance(timeDistance)
-    # continue a route
-    else:
-        prevStartStation = route[-1]["startStation"]
-        startStation = route[-1]["endStation"]
-        time = route[-1]["endTime"]
-        key = startStation+" "+time
-        if prevStartStation not in index[key]:
-            sys.exit(f"error in traintrips.txt! ({prevStart})")
-        for endStation in sort_stations(index[key][prevStartStation], prevStartStation, startStation):
-            track = startStation+" "+endStation
-            endTime = index[key][prevStartStation][endStation][0]["endTime"]
+        rootNumber = 0
+        for key in startKeys(state,index):
+            for trip in startTrips(state,index,key):
+                if searchStats["stopped"] is not None: return()
+                state.currentRoot = rootNumber
+                if checkpoint is None or rootNumber > checkpoint["root"]:
+                    startRoute(state,index,trip)
+                elif rootNumber == checkpoint["root"]:
+                    if len(checkpoint["frames"]) == 0: startRoute(state,index,trip)
+                    else: 
+                        state.maxTime = checkpoint["maxTime"]
+                        findRoute(state,index,checkpoint["route"],checkpoint["travelled"],checkpoint["distance"],checkpoint["frames"])
+                rootNumber += 1
+            # store new time-distance data for this start station
+            if state.routeCollector is None and (checkpoint is None or rootNumber > checkpoint["root"]):
+                writeCheckpoint(state,rootNumber)
+        return()
+
+    trainTrips = network["trainTrips"]
+    startTimes = trainTrips["startTime"]
+    tripEndStations = trainTrips["endStation"]
+    endTimes = trainTrips["endTime"]
+    distances = trainTrips["distance"]
+    tracks = trainTrips["track"]
+    averageSpeeds = trainTrips["averageSpeed"]
+    trackBits = network["trackBits"]
+    trackMasks = network["trackMasks"]
+    partnerMasks = network["partnerMasks"]
+    requiredVisitsAt = network["requiredVisitsAt"]
+    requiredVisitBits = network["requiredVisitBits"]
+    ignoreTransferSafetyTimes = network["ignoreTransferSafetyTimes"]
+    table = network["timeDistance"]
+    base = timeDistanceRow(network,route[0]["startStation"],route[0]["startTime"])*network["timeDistanceWidth"]
+    beamSize = state.beamSize
+    maxTime = state.maxTime
+    givenTravelled,givenDistance = travelled,distance
+    countStats = state.statsFile != ""
+    # the transposition table only holds states of this search: the beam of other searches may differ
+    memo = state.memoTable
+    memo.clear()
+    searchCounts = state.searchCounts
+    nodesPerDepth = searchCounts["nodesPerDepth"]
+    pruned = searchCounts["pruned"]
+    stack = []
+    newEnd = True # the last trip of route has not been visited yet
+    # (track, repeated track?, distance, route distance, visits before the trip) of the last trip,
+    # None for the given route
+    lastTrip = None
+    visits = routeVisits(network,route) # required visits made by the route
+    if frames is not None:
+        stack,travelled,distance,visits = resumeStack(state,index,route,travelled,distance,frames)
+        newEnd = False
+    checkpointCountdown = countdownStart = stepsToCheck(state)
+    while True:
+        if newEnd:
+            newEnd = False
+            last = route[-1]
+            if countStats:
+                while len(nodesPerDepth) <= len(route): nodesPerDepth.append(0)
+                nodesPerDepth[len(route)] += 1
+            if distance > 0:
+                if table[base+last["endTime"]] < distance:
+                    table[base+last["endTime"]] = distance
+                    fillTimeDistance(network,base,last["endTime"],distance)
+                    last["lessThanBest"] = 0.0
+                if distance >= state.maxDistance: 
+                    state.maxDistance = distance
+                    reportRoute(state,route,distance)
+                    sharedMaxDistance = state.sharedMaxDistance
+                    if sharedMaxDistance is not None and distance > sharedMaxDistance[0]: sharedMaxDistance[0] = distance
+                if state.topSize > 0 and (len(state.topRoutes) < state.topSize or distance > state.topRoutes[0][0]):
+                    collectRoute(state,route,distance,undirectedTracks(network,travelled))
+            prevStartStation = last["startStation"]
+            startStation = last["endStation"]
+            key = (startStation,last["endTime"])
+            if prevStartStation not in index[key]:
+                sys.exit(f"error in traintrips.txt! ({network['stationNames'][prevStartStation]})")
+            # transposition table: skip this route if an earlier route reached the same state with
+            # at least the same distance: its continuations have been tried already
+            known = False
+            if state.memoSize > 0:
+                memoKey = memoState(state,last,travelled,visits)
+                memoDistance = memo.get(memoKey)
+                if memoDistance is not None and distance <= memoDistance: known = True
+                else: memo[memoKey] = distance
+                memo.move_to_end(memoKey)
+                if len(memo) > state.memoSize: memo.popitem(last=False)
+            if known:
+                trips = ()
+                if countStats: pruned["memo"] += 1
+            # branch and bound: skip this route if it cannot become longer than the longest route found
+            # (not when maxTime still depends on the next trip, see below)
+            elif state.branchAndBound and (len(route) > 1 or last["distance"] > 0.0) and \
+               distance+upperBounds(network,index,maxTime)[key][prevStartStation] < longestDistance(state):
+                trips = ()
+                if countStats: pruned["bound"] += 1
+            elif state.branchAndBound and visitOutOfReach(network,visits,startStation,last["endTime"]):
+                trips = ()
+                if countStats: pruned["visitOutOfReach"] += 1
+            else:
+                endStations = index[key][prevStartStation]
+                if state.ordering != "speed": endStations = orderStations(state, endStations, prevStartStation, startStation, travelled)
+                trips = departureOptions(state,index[key][prevStartStation],endStations)
+            stack.append((iter(trips),lastTrip))
+        if len(stack) == 0: break
+        checkpointCountdown -= 1
+        if checkpointCountdown == 0:
+            searchStats["steps"] += countdownStart
+            checkpointCountdown = countdownStart = stepsToCheck(state)
+            # anytime search: stop, the longest route found so far has been reported; the
+            # checkpoint lets --resume continue the search
+            if searchLimitReached(state): 
+                if state.routeCollector is None: writeCheckpoint(state,state.currentRoot,route,stack,givenTravelled,givenDistance)
+                break
+            if state.deadline is None and state.routeCollector is None and time.time() >= state.nextCheckpointTime:
+                writeCheckpoint(state,state.currentRoot,route,stack,givenTravelled,givenDistance)
+            if countStats and state.routeCollector is None and time.time() >= state.nextStatsTime: writeStats(state)
+            if state.topChanged and state.routeCollector is None and time.time() >= state.nextTopTime: showTopRoutes(state)
+        tripsIter,lastTrip = stack[-1]
+        last = route[-1]
+        visitStation = last["endStation"] in requiredVisitsAt
+        for trip in tripsIter:
+            endStation = tripEndStations[trip]
+            endTime = endTimes[trip]
             if endTime <= maxTime:
-                repeatedTrack = track in travelled
-                startTime = index[key][prevStartStation][endStation][0]["startTime"]
-                if len(route) == 1 and route[-1]["distance"] == 0.0:
-                    maxTime = computeMaxTime(startTime)
-                waitingTime = minutes2time(time2minutes(startTime)-time2minutes(route[-1]["endTime"]))
-                if endStation != route[-1]["startStation"] or (not block_turning_back and (waitingTime >= MINRETURNWAITINGTIME or ignoreTransferSafetyTimes)):
+                track = tracks[trip]
+                repeatedTrack = travelled & trackBits[track]
+                startTime = startTimes[trip]
+                if len(route) == 1 and last["distance"] == 0.0:
+                    maxTime = state.maxTime = computeMaxTime(network,startTime)
+                waitingTime = startTime-last["endTime"]
+                if endStation != last["startStation"] or (not state.block_turning_back and (waitingTime >= MINRETURNWAITINGTIME or ignoreTransferSafetyTimes)):
                     thisDistance = 0.0
                     if not repeatedTrack:
-                        thisDistance = index[key][prevStartStation][endStation][0]["distance"]
-                        if track in partners:
-                            for i in range(0,len(partners[track])):
-                                if partners[track][i]["partner"] in travelled:
-                                    thisDistance -= partners[track][i]["distance"]
-                    if thisDistance > 0 or route[-1]["distance"] > 0:
+                        thisDistance = distances[trip]
+                        overlap = travelled & partnerMasks[track]
+                        if overlap: 
+                            if countStats:
+                                searchCounts["partnerOverlaps"] += 1
+                                searchCounts["partnerDeduction"] += thisDistance-coveredDistance(network,track,thisDistance,overlap)
+                            thisDistance = coveredDistance(network,track,thisDistance,overlap)
+                    if thisDistance > 0 or last["distance"] > 0:
                         # add track
-                        if not repeatedTrack:
-                            travelled[track] = True
-                            if track not in can_travel_back:
-                                travelled[reverseTrack(track)] = True
-                        lastTrackPair = route[-1]["startStation"]+" "+route[-1]["endStation"]+" "+track
-                        lastTrackPairEndTime = lastTrackPair+" "+time
+                        if not repeatedTrack: travelled ^= trackMasks[track]
                         distance += thisDistance
-                        averageSpeed = index[key][prevStartStation][endStation][0]["averageSpeed"]
-                        keyTD = route[0]["startStation"]+" "+route[0]["startTime"]+" "+endTime
                         lessThanBest = 0.0
-                        if keyTD in timeDistance: lessThanBest = timeDistance[keyTD]-distance
-                        route.append({"startStation":startStation,"endStation":endStation,"startTime":startTime,"endTime":endTime,"distance":thisDistance,"averageSpeed":averageSpeed,"waitingTime":waitingTime,"lessThanBest":lessThanBest})
-                        # continue search
-                        if centerVisited(route) and lessThanBest <= beamSize and \
-                           (not lastTrackPair in transfers or waitingTime >= transfers[lastTrackPair] or ignoreTransferSafetyTimes) and \
-                           (not lastTrackPairEndTime in transfers or waitingTime >= transfers[lastTrackPairEndTime] or ignoreTransferSafetyTimes):
-                            findRoute(index,route,travelled,distance)
+                        if table[base+endTime] != NOROUTE: lessThanBest = table[base+endTime]-distance
+                        route.append({"startStation":last["endStation"],"endStation":endStation,"startTime":startTime,"endTime":endTime,"distance":thisDistance,"averageSpeed":averageSpeeds[trip],"waitingTime":waitingTime,"lessThanBest":lessThanBest})
+                        newVisits = visits
+                        if visitStation: newVisits |= visitBits(network,last["endStation"],last["endTime"],startTime,waitingTime)
+                        # continue search; the minimal transfer times have already been checked by makeIndex
+                        if not requiredVisitBits[endTime] & ~newVisits and lessThanBest <= beamSize:
+                            newEnd = True
+                            lastTrip = (track,repeatedTrack,thisDistance,distance,visits)
+                            visits = newVisits
+                            break
+                        if countStats: pruned["beam" if not requiredVisitBits[endTime] & ~newVisits else "visit"] += 1
                         # delete track
                         if not repeatedTrack:
-                            del travelled[track]
-                            if track not in can_travel_back:
-                                del travelled[reverseTrack(track)]
+                            travelled ^= trackMasks[track]
                             distance -= thisDistance
                         route.pop(-1)
+                    elif countStats: pruned["noDistance"] += 1
+                elif countStats: pruned["turnBack"] += 1
+            elif countStats: pruned["maxTime"] += 1
+        else:
+            # all next destinations have been tried: delete the last track, unless it was given
+            stack.pop(-1)
+            if lastTrip is not None:
+                # restore the distance rather than keep the rounding errors of the later trips
+                track,repeatedTrack,thisDistance,distance,visits = lastTrip
+                if not repeatedTrack:
+                    travelled ^= trackMasks[track]
+                    distance -= thisDistance
+                route.pop(-1)
+    searchStats["steps"] += countdownStart-checkpointCountdown
+
+# start counting the search steps and the search time of a new search
+def startSearchStats(state):
+    state.searchStats.update({"steps":0,"stopped":None,"startTime":time.time(),"firstRouteTime":None,"bestRouteTime":None})
+    resetSearchCounts(state)
+
+# remember when the search found its first and its latest longest route
+def noteRouteTime(state):
+    now = time.time()
+    if state.searchStats["firstRouteTime"] is None: state.searchStats["firstRouteTime"] = now
+    state.searchStats["bestRouteTime"] = now
+
+def resetSearchCounts(state):
+    state.searchCounts.update({"nodesPerDepth":[],"pruned":{ reason:0 for reason in PRUNEREASONS },"partnerOverlaps":0,"partnerDeduction":0.0})
+
+# report the statistics of the search
+def printSearchStats(state):
+    searchStats = state.searchStats
+    print("# search steps : %d" % (searchStats["steps"]))
+    print("# search time : %0.1f seconds" % (time.time()-searchStats["startTime"]))
+    if searchStats["stopped"] is None: print("# search complete")
+    else: print("# search stopped at the "+searchStats["stopped"])
+
+# add the search counts of a worker process (see searchRoots)
+def addSearchCounts(state,counts):
+    searchCounts = state.searchCounts
+    for depth,nodes in enumerate(counts["nodesPerDepth"]):
+        if depth >= len(searchCounts["nodesPerDepth"]): searchCounts["nodesPerDepth"].append(0)
+        searchCounts["nodesPerDepth"][depth] += nodes
+    for reason in PRUNEREASONS: searchCounts["pruned"][reason] += counts["pruned"][reason]
+    searchCounts["partnerOverlaps"] += counts["partnerOverlaps"]
+    searchCounts["partnerDeduction"] += counts["partnerDeduction"]
+
+# write the search statistics to the statistics file in JSON format, via a temporary file
+def writeStats(state):
+    searchStats,searchCounts = state.searchStats,state.searchCounts
+    searchSeconds = time.time()-searchStats["startTime"] if "startTime" in searchStats else 0.0
+    # seconds until the first and the last longest route were found
+    routeSeconds = [ None if searchStats[name] is None else searchStats[name]-searchStats["startTime"] for name in ["firstRouteTime","bestRouteTime"] ]
+    nodes = sum(searchCounts["nodesPerDepth"])
+    stats = {"options":state.searchOptions,"beamSize":state.beamSize,"longestRoute":state.maxDistance,
+             "seconds":dict(timings,search=searchSeconds),"indexCached":indexStats["cached"],
+             "transferSkippedTrips":indexStats["transferSkippedTrips"],
+             "steps":searchStats["steps"],"nodes":nodes,"nodesPerSecond":nodes/searchSeconds if searchSeconds > 0 else 0.0,
+             "stopped":searchStats["stopped"],"firstRouteSeconds":routeSeconds[0],"bestRouteSeconds":routeSeconds[1],
+             "nodesPerDepth":searchCounts["nodesPerDepth"],"pruned":searchCounts["pruned"],
+             "partnerOverlaps":searchCounts["partnerOverlaps"],"partnerDeduction":searchCounts["partnerDeduction"]}
+    try: 
+        outFile = open(state.statsFile+".tmp","w")
+        outFile.write(json.dumps(stats,indent=1)+"\n")
+        outFile.close()
+        os.replace(state.statsFile+".tmp",state.statsFile)
+    except: sys.exit(COMMAND+": cannot write file "+state.statsFile+"\n")
+    state.nextStatsTime = time.time()+STATSINTERVAL
+
+# number of search steps until the next check of the search limits and the checkpoint time
+def stepsToCheck(state):
+    if state.nodeLimit is None: return(CHECKPOINTNODES)
+    return(max(1,min(CHECKPOINTNODES,state.nodeLimit-state.searchStats["steps"])))
+
+# check the time and node limits of the search, and remember which limit stopped the search
+def searchLimitReached(state):
+    searchStats = state.searchStats
+    if searchStats["stopped"] is None:
+        if state.nodeLimit is not None and searchStats["steps"] >= state.nodeLimit: searchStats["stopped"] = "node limit"
+        elif state.deadline is not None and time.time() >= state.deadline: searchStats["stopped"] = "time limit"
+    return(searchStats["stopped"] is not None)
+
+# compute upper bounds on the distance that can still be covered when being at a station at a
+# certain time (index key) coming from a previous station, for routes that end before maxTime:
+# the longest chain of trips in the index, ignoring repeated tracks and partner tracks
+def makeUpperBounds(network,index,maxTime):
+    endTimes = network["trainTrips"]["endTime"]
+    distances = network["trainTrips"]["distance"]
+    upperBounds = {}
+    # later keys first: every trip ends at a later key than the key it starts from
+    for key in sorted(index,key=lambda key: key[1],reverse=True):
+        upperBounds[key] = {}
+        for prevStartStation in index[key]:
+            upperBound = 0.0
+            for endStation in index[key][prevStartStation]:
+                for trip in range(*index[key][prevStartStation][endStation]):
+                    if endTimes[trip] <= maxTime:
+                        upperBound = max(upperBound,distances[trip]+upperBounds[(endStation,endTimes[trip])][key[0]])
+            upperBounds[key][prevStartStation] = upperBound
+    return(upperBounds)
+
+# the longest distance found so far, in a parallel search by any of the processes; this is a
+# monotone update without locks, like fillTimeDistance: a lost update only weakens the pruning
+def longestDistance(state):
+    if state.sharedMaxDistance is None: return(state.maxDistance)
+    return(max(state.maxDistance,state.sharedMaxDistance[0]))
+
+# get the upper bounds for routes ending before maxTime, compute them when needed; the roots of
+# a search have many different maxTimes: the bounds of a later maxTime are also bounds for an
+# earlier maxTime, so maxTime is rounded up to limit the number of tables, and only the most
+# recently used tables are kept
+def upperBounds(network,index,maxTime):
+    upperBoundsCache = network["upperBoundsCache"]
+    maxTime = -(-maxTime//UPPERBOUNDSSTEP)*UPPERBOUNDSSTEP
+    if maxTime in upperBoundsCache: upperBoundsCache.move_to_end(maxTime)
+    else:
+        upperBoundsCache[maxTime] = makeUpperBounds(network,index,maxTime)
+        if len(upperBoundsCache) > UPPERBOUNDSCACHESIZE: upperBoundsCache.popitem(last=False)
+    return(upperBoundsCache[maxTime])
+
+# the trips to try from an index entry (next destinations to trip ranges) for each of the
+# endStations: the first trip to each destination or, with allDepartures, all trips of the range
+# that are not followed by a trip of the range that arrives earlier
+def departureOptions(state,destinations,endStations):
+    if not state.allDepartures: return([ destinations[endStation][0] for endStation in endStations ])
+    nextBetter = state.network["trainTrips"]["nextBetter"]
+    trips = []
+    for endStation in endStations:
+        first,last = destinations[endStation]
+        trips.extend([ trip for trip in range(first,last) if nextBetter[trip] >= last ])
+    return(trips)
+
+# index keys of the stations where routes can start
+def startKeys(state,index):
+    stationNames = state.network["stationNames"]
+    keys = []
+    for key in index:
+        if len(key) < 2: 
+            sys.exit(COMMAND+": incorrect key in index: "+str(key)+"\n")
+        if key[1] == state.globalStartTime and (state.firstStation == "" or stationNames[key[0]] == state.firstStation):
+            keys.append(key)
+    return(keys)
 
-def readRoute(fileName):
-    global maxTime
+# first trips of the routes starting at an index key
+def startTrips(state,index,key):
+    startTimes = state.network["trainTrips"]["startTime"]
+    trips = []
+    startStation = key[0]
+    for endStation in index[key][startStation]:
+        # all trips from the start time of the competition
+        if key[1] == TIMEZERO: options = range(*index[key][startStation][endStation])
+        else: options = departureOptions(state,index[key][startStation],[endStation])
+        for trip in options:
+            if state.globalStartTime == TIMEZERO or startTimes[trip] == state.globalStartTime:
+                trips.append(trip)
+    return(trips)
 
+# search the routes that start with a trip
+def startRoute(state,index,trip):
+    network = state.network
+    trainTrips = network["trainTrips"]
+    startTime = trainTrips["startTime"][trip]
+    state.maxTime = computeMaxTime(network,startTime)
+    route = [{"startStation":trainTrips["startStation"][trip],"endStation":trainTrips["endStation"][trip],
+              "startTime":startTime,"endTime":trainTrips["endTime"][trip],"distance":trainTrips["distance"][trip],
+              "averageSpeed":trainTrips["averageSpeed"][trip],"waitingTime":startTime-TIMEZERO,"lessThanBest":0.0}]
+    findRoute(state,index,route,network["trackMasks"][trainTrips["track"][trip]],trainTrips["distance"][trip])
+
+# worker process: search the routes starting with a list of first trips; return the routes found
+# per first trip, the number of search steps, the reason for stopping the search, if any, the
+# search counts and the diverse routes (with topSize); the time-distance data are shared with
+# the other processes; the search state is the copy of parallelState of the process
+def searchRoots(roots):
+    state = parallelState
+    searchStats = state.searchStats
+    state.maxDistance = state.parallelStartDistance
+    results = []
+    steps = searchStats["steps"]
+    resetSearchCounts(state)
+    state.topRoutes.clear()
+    for rootNumber,trip in roots:
+        state.routeCollector = []
+        if searchStats["stopped"] is None: startRoute(state,state.network["index"],trip)
+        results.append((rootNumber,state.routeCollector))
+    state.routeCollector = None
+    return(results,searchStats["steps"]-steps,searchStats["stopped"],state.searchCounts,state.topRoutes)
+
+# search from all start stations with several processes. The time-distance table is moved to
+# shared memory so that all processes can use the best distances found by the others. By
+# default the first trips of routes with the same start station and start time, which use the
+# same time-distance row, are searched by one process, in the order of the serial search: the
+# results are the same as those of findRoute. With splitStartTrips, each first trip is a separate
+# task: this divides the work better but the results may differ from those of a serial search.
+# With branch and bound (-x), the processes share the longest distance found, for pruning: the
+# pruning then depends on the progress of the other processes, so the results may also differ.
+# The parent process prints the routes in the same order as findRoute. When continuing from a
+# checkpoint, a partly searched start trip is searched again from its start.
+def findRouteParallel(state,index,nbrOfProcesses,splitStartTrips):
+    global parallelState
+
+    network = state.network
+    searchStats = state.searchStats
+    checkpoint = state.checkpoint
+    groups = {}
+    keyEnds = {} # root numbers that follow the last first trip of a start station
+    rootNumber = 0
+    for key in startKeys(state,index):
+        for trip in startTrips(state,index,key):
+            group = (key[0],network["trainTrips"]["startTime"][trip])
+            if checkpoint is None or rootNumber >= checkpoint["root"]:
+                if not group in groups: groups[group] = []
+                groups[group].append((rootNumber,trip))
+            rootNumber += 1
+        keyEnds[rootNumber] = True
+    if rootNumber == 0: return()
+    # all rows must exist before the table is moved to shared memory
+    for startStation,startTime in groups: timeDistanceRow(network,startStation,startTime)
+    if splitStartTrips: tasks = sorted([ [root] for group in groups.values() for root in group ])
+    else: tasks = list(groups.values())
+    timeDistance = network["timeDistance"]
+    size = len(timeDistance)*timeDistance.itemsize
+    sharedMemory = shared_memory.SharedMemory(create=True,size=size)
+    sharedTable = sharedMemory.buf[:size].cast("d")
+    sharedTable[:] = timeDistance
+    network["timeDistance"] = sharedTable
+    sharedDistanceMemory = shared_memory.SharedMemory(create=True,size=array("d").itemsize)
+    state.sharedMaxDistance = sharedDistanceMemory.buf[:array("d").itemsize].cast("d")
+    state.sharedMaxDistance[0] = state.maxDistance
+    state.parallelStartDistance = state.maxDistance
+    parallelState = state
+    foundRoutes = {}
+    nextRoot = 0 if checkpoint is None else checkpoint["root"]
+    try:
+        # worker processes need a copy of the index and the other global data: use fork
+        with multiprocessing.get_context("fork").Pool(nbrOfProcesses) as pool:
+            for results,steps,stopped,counts,workerTopRoutes in pool.imap(searchRoots,tasks):
+                searchStats["steps"] += steps
+                if stopped is not None: searchStats["stopped"] = stopped
+                if state.statsFile != "": 
+                    addSearchCounts(state,counts)
+                    if time.time() >= state.nextStatsTime: writeStats(state)
+                for distance,tracks,text,trips in workerTopRoutes: collectRoute(state,(text,trips),distance,tracks)
+                if state.topChanged and time.time() >= state.nextTopTime: showTopRoutes(state)
+                for rootNumber,routes in results: foundRoutes[rootNumber] = routes
+                while nextRoot in foundRoutes:
+                    for distance,text,trips in foundRoutes.pop(nextRoot):
+                        if distance >= state.maxDistance:
+                            state.maxDistance = distance
+                            if state.topSize == 0: sys.stdout.write(text)
+                            state.bestRoute = text
+                            noteRouteTime(state)
+                    nextRoot += 1
+                    # store new time-distance data for each completed start station
+                    if nextRoot in keyEnds:
+                        sys.stdout.flush()
+                        writeCheckpoint(state,nextRoot)
+    finally:
+        # move the time-distance table back to local memory
+        parallelState = None
+        network["timeDistance"] = array("d",sharedTable)
+        sharedTable.release()
+        sharedMemory.close()
+        sharedMemory.unlink()
+        state.sharedMaxDistance.release()
+        state.sharedMaxDistance = None
+        sharedDistanceMemory.close()
+        sharedDistanceMemory.unlink()
+
+def readRoute(state,fileName):
     try: inFile = open(fileName,"r")
     except: sys.exit(COMMAND+": cannot read file "+fileName+"\n")
     route = []
-    travelled = {}
+    travelled = 0
     totalDistance = 0
     patternHashStart = re.compile("^#")
     patternNumberChar = re.compile("^[0-9][0-9a-z]*")
@@ -429,59 +1408,459 @@ def readRoute(fileName):
         if len(fields) < 8: sys.exit(COMMAND+": unexpected line in file "+fileName+": "+line+"\n")
         # remove final number from list (make its presence optional)
         while len(fields) > 0 and patternNumberChar.match(fields[-1]): fields.pop(-1)
-        startTime = fields[0]
-        if len(route) == 0: maxTime = computeMaxTime(startTime)
-        endTime = fields[1]
-        waitingTime = fields[2]
+        startTime = time2minutes(fields[0])
+        if len(route) == 0: state.maxTime = computeMaxTime(state.network,startTime)
+        endTime = time2minutes(fields[1])
+        waitingTime = time2minutes(fields[2])
         distance = float(fields[3])
         totalDistance += distance
         lessThanBest = float(fields[4])
         averageSpeed = int(fields[5])
-        startStation = fields[-2]
-        endStation = fields[-1]
         for station in fields[-2:]:
             if not station in stations:
                 sys.exit(COMMAND+": unknown station in file "+fileName+" : "+station+"\n")
-        track = startStation+" "+endStation
-        travelled[track] = True
-        if track not in can_travel_back:
-            travelled[reverseTrack(track)] = True
+        startStation = stations[fields[-2]]
+        endStation = stations[fields[-1]]
+        travelled |= trackMask(getTrack(startStation,endStation))
         route.append({"startStation":startStation,"endStation":endStation,"startTime":startTime,"endTime":endTime,"distance":distance,"waitingTime":waitingTime,"averageSpeed":averageSpeed,"lessThanBest":lessThanBest})
     inFile.close()
     return({"travelled":travelled, "route":route, "distance":totalDistance})
 
+# get the station id of a station name of a replanning command
+def replanStation(name):
+    if not name in stations: raise ValueError("unknown station: "+name)
+    return(stations[name])
+
+# get the minutes of a time (HH:MM) of a replanning command
+def replanTime(value):
+    if not re.match(r"^\d\d:\d\d$",value): raise ValueError("unexpected time: "+value)
+    return(time2minutes(value))
+
+# replanning during the competition: read commands from a file (for example /dev/tty or a named
+# pipe), see REPLANHELP. The index stays in memory, schedule changes patch it. A search stops at
+# its deadline and prints the longest route found; the routes are collected like in worker
+# processes. The time-distance row of the route so far is cleared before each search: it may
+# be based on trips that can no longer be taken
+def replan(state,index,fileName):
+    network = state.network
+    try: inFile = open(fileName,"r")
+    except: sys.exit(COMMAND+": cannot read file "+fileName+"\n")
+    print(REPLANHELP)
+    sys.stdout.flush()
+    route,travelled,distance = [],0,0
+    for line in inFile:
+        fields = line.split()
+        if len(fields) == 0 or fields[0].startswith("#"): continue
+        command = fields.pop(0)
+        try:
+            if command == "route" and len(fields) == 1:
+                readRouteResults = readRoute(state,fields[0])
+                route,travelled,distance = readRouteResults["route"],readRouteResults["travelled"],readRouteResults["distance"]
+                if len(route) == 0: raise ValueError("no trips in file "+fields[0])
+                print("# route ends at %s %s, distance %0.1f" % (stationNames[route[-1]["endStation"]],minutes2time(route[-1]["endTime"]),distance))
+            elif command == "at" and len(fields) == 2:
+                station,endTime = replanStation(fields[0]),replanTime(fields[1])
+                if len(route) == 0: raise ValueError("no route so far, use the command route first")
+                if station != route[-1]["endStation"]: 
+                    raise ValueError("the route so far ends at "+stationNames[route[-1]["endStation"]])
+                if endTime <= route[-1]["startTime"]: raise ValueError("time not after the start of the last trip")
+                route[-1]["endTime"] = endTime
+                print("# route ends at %s %s" % (fields[0],minutes2time(endTime)))
+            elif command in ["add","cancel"] and len(fields) == 4:
+                startStation,endStation = replanStation(fields[0]),replanStation(fields[1])
+                changeTrip = addTrip if command == "add" else removeTrip
+                staleKeys = changeTrip(index,startStation,endStation,replanTime(fields[2]),replanTime(fields[3]))
+                for staleKey in staleKeys:
+                    base = timeDistanceRows[staleKey]*timeDistanceWidth
+                    timeDistance[base:base+timeDistanceWidth] = array("d",[NOROUTE])*timeDistanceWidth
+                print("# schedule changed, %d time-distance rows cleared" % (len(staleKeys)))
+            elif command == "transfer" and len(fields) in [5,6]:
+                for station in fields[1:5]: replanStation(station)
+                trackPair = (getTrack(stations[fields[1]],stations[fields[2]]),getTrack(stations[fields[3]],stations[fields[4]]))
+                if len(fields) > 5: trackPair += (replanTime(fields[5]),)
+                setTransfer(index,trackPair,replanTime(fields[0]))
+                print("# transfer time changed")
+            elif command == "search" and len(fields) <= 1:
+                if len(route) == 0: raise ValueError("no route so far, use the command route first")
+                budget = float(fields[0]) if len(fields) > 0 else REPLANBUDGET
+                last = route[-1]
+                addIndexEntry(index,(last["endStation"],last["endTime"]),last["startStation"])
+                base = timeDistanceRow(network,route[0]["startStation"],route[0]["startTime"])*timeDistanceWidth
+                timeDistance[base:base+timeDistanceWidth] = array("d",[NOROUTE])*timeDistanceWidth
+                state.maxTime = computeMaxTime(network,route[0]["startTime"])
+                state.maxDistance,state.routeCollector = 0,[]
+                startSearchStats(state)
+                state.deadline = state.searchStats["startTime"]+budget
+                # findRoute may stop with extra trips in the route: search a copy
+                findRoute(state,index,[ dict(trip) for trip in route ],travelled,distance)
+                routes,state.routeCollector,state.deadline = state.routeCollector,None,None
+                if len(routes) == 0: print("# no route found")
+                else: sys.stdout.write(routes[-1][1])
+                printSearchStats(state)
+            elif command == "quit": break
+            else: print("# unknown command: "+line.strip()+"\n"+REPLANHELP)
+        except (SystemExit,ValueError) as exception:
+            print("# error: "+str(exception).strip())
+        sys.stdout.flush()
+    inFile.close()
+
+# write the state of the search to the checkpoint file, after the time-distance table: the
+# options, the number of the first start trip (root) that has not been searched completely,
+# the longest route found and, for a partly searched root, the route that is being extended
+# with per frame the number of next destinations that still have to be tried
+def writeCheckpoint(state,rootNumber,route=[],stack=[],travelled=0,distance=0.0):
+    writeTimeDistanceTable(timeDistance)
+    # a checkpoint cannot continue a widening search: it does not contain the beam size
+    if state.beamWidening is not None: return()
+    lines = [CHECKPOINTHEADER+"\n","options %d\n" % (len(state.searchOptions))]
+    lines += [ option+"\n" for option in state.searchOptions ]
+    lines.append("root %d\n" % (rootNumber))
+    lines.append("maxDistance %r\n" % (state.maxDistance))
+    lines.append("maxTime %d\n" % (state.maxTime))
+    lines.append("best %d\n" % (state.bestRoute.count("\n")))
+    lines.append(state.bestRoute)
+    lines.append("travelled %x\n" % (travelled))
+    lines.append("distance %r\n" % (distance))
+    lines.append("route %d\n" % (len(route)))
+    for trainTrip in route:
+        lines.append("%s %s %d %d %r %r %d %r\n" % (stationNames[trainTrip["startStation"]],stationNames[trainTrip["endStation"]],trainTrip["startTime"],trainTrip["endTime"],trainTrip["distance"],trainTrip["averageSpeed"],trainTrip["waitingTime"],trainTrip["lessThanBest"]))
+    lines.append("frames %d\n" % (len(stack)))
+    for tripsIter,lastTrip in stack:
+        if lastTrip is None: lines.append("%d -\n" % (length_hint(tripsIter)))
+        else: lines.append("%d %r\n" % (length_hint(tripsIter),lastTrip[3]))
+    try: 
+        outFile = open(CHECKPOINTFILE+".tmp","w")
+        outFile.write("".join(lines))
+        outFile.close()
+        os.replace(CHECKPOINTFILE+".tmp",CHECKPOINTFILE)
+    except: sys.exit(COMMAND+": cannot write file "+CHECKPOINTFILE+"\n")
+    state.nextCheckpointTime = time.time()+CHECKPOINTINTERVAL
+
+# read the checkpoint file written by writeCheckpoint; the stations must have been read
+def readCheckpoint():
+    try: inFile = open(CHECKPOINTFILE,"r")
+    except: sys.exit(COMMAND+": cannot read file "+CHECKPOINTFILE+"\n")
+    lines = inFile.read().split("\n")
+    inFile.close()
+    # get the value of the next line, which should start with name
+    def nextValue(name):
+        fields = lines.pop(0).split() if len(lines) > 0 else []
+        if len(fields) != 2 or fields[0] != name: 
+            sys.exit(COMMAND+": unexpected data in file "+CHECKPOINTFILE+", expected: "+name+"\n")
+        return(fields[1])
+    if lines.pop(0) != CHECKPOINTHEADER: sys.exit(COMMAND+": unexpected header in file "+CHECKPOINTFILE+"\n")
+    checkpoint = {}
+    nbrOfLines = int(nextValue("options"))
+    checkpoint["options"],lines = lines[:nbrOfLines],lines[nbrOfLines:]
+    checkpoint["root"] = int(nextValue("root"))
+    checkpoint["maxDistance"] = float(nextValue("maxDistance"))
+    checkpoint["maxTime"] = int(nextValue("maxTime"))
+    nbrOfLines = int(nextValue("best"))
+    checkpoint["bestRoute"] = "".join([ line+"\n" for line in lines[:nbrOfLines] ])
+    lines = lines[nbrOfLines:]
+    checkpoint["travelled"] = int(nextValue("travelled"),16)
+    checkpoint["distance"] = float(nextValue("distance"))
+    checkpoint["route"] = []
+    for i in range(0,int(nextValue("route"))):
+        fields = lines.pop(0).split()
+        if len(fields) != 8 or not fields[0] in stations or not fields[1] in stations:
+            sys.exit(COMMAND+": unexpected route data in file "+CHECKPOINTFILE+"\n")
+        checkpoint["route"].append({"startStation":stations[fields[0]],"endStation":stations[fields[1]],"startTime":int(fields[2]),"endTime":int(fields[3]),"distance":float(fields[4]),"averageSpeed":float(fields[5]),"waitingTime":int(fields[6]),"lessThanBest":float(fields[7])})
+    checkpoint["frames"] = []
+    for i in range(0,int(nextValue("frames"))):
+        remaining,distance = lines.pop(0).split()
+        checkpoint["frames"].append((int(remaining),None if distance == "-" else float(distance)))
+    return(checkpoint)
+
+# rebuild the stack of findRoute for a route read from a checkpoint file; travelled and
+# distance are the values for the end of the route before the first frame
+def resumeStack(state,index,route,travelled,distance,frames):
+    network = state.network
+    trackBits,trackMasks = network["trackBits"],network["trackMasks"]
+    stack = []
+    lastTrip = None
+    nbrOfGiven = len(route)-len(frames)+1
+    visits = routeVisits(network,route[:nbrOfGiven])
+    for i in range(0,len(frames)):
+        remaining,frameDistance = frames[i]
+        last = route[nbrOfGiven-1+i]
+        if i > 0:
+            # the track of the trip which was selected in the previous frame
+            track = network["trackIds"][(last["startStation"],last["endStation"])]
+            repeatedTrack = travelled & trackBits[track]
+            if not repeatedTrack: travelled ^= trackMasks[track]
+            distance = frameDistance
+            lastTrip = (track,repeatedTrack,last["distance"],distance,visits)
+            visits |= routeVisits(network,route[nbrOfGiven-2+i:nbrOfGiven+i])
+        key = (last["endStation"],last["endTime"])
+        destinations = index[key][last["startStation"]]
+        endStations = destinations
+        if state.ordering != "speed": endStations = orderStations(state, endStations, last["startStation"], last["endStation"], travelled)
+        trips = departureOptions(state,destinations,endStations)
+        stack.append((iter(trips[len(trips)-remaining:]),lastTrip))
+    return(stack,travelled,distance,visits)
+
+# content hash of the data that determine the routes: the train trips and the data files
+def scheduleHash(trainTripsText):
+    digest = hashlib.sha256()
+    for fileName in [STATIONSFILE,TRANSFERSFILE,NEXTDESTINATIONS,PARTNERFILE,CANTRAVELBACK,REQUIREDVISITSFILE]:
+        try: 
+            inFile = open(fileName,"rb")
+            data = inFile.read()
+            inFile.close()
+        except: data = b""
+        digest.update(b"%d\n" % (len(data)))
+        digest.update(data)
+    digest.update(trainTripsText.encode())
+    return(digest.hexdigest())
+
+# the options (from getopt) that change the search, in a fixed order, for the results file
+def resultsFlags(options):
+    flags = sorted([ (option,value) for option,value in options if not option in RESULTSIGNOREDOPTIONS ])
+    return(" ".join([ (option+" "+value).strip() for option,value in flags ]))
+
+# open the results file, create the results table if needed
+def openResults(fileName):
+    try: 
+        connection = sqlite3.connect(fileName)
+        connection.execute(RESULTSTABLE)
+        # results files of earlier versions have no column seed
+        columns = [ column[1] for column in connection.execute("pragma table_info(results)") ]
+        if not "seed" in columns: connection.execute("alter table results add column seed real default 0.0")
+    except sqlite3.Error as e: sys.exit(COMMAND+": cannot open results file "+fileName+": "+str(e)+"\n")
+    return(connection)
+
+# stored results for a results key (schedule, station, start time, beam size, flags), for all
+# beam sizes: list of (beam size, distance, route, complete, seed)
+def readResults(connection,key):
+    schedule,station,startTime,beamSize,flags = key
+    return(connection.execute("select beamSize, distance, route, complete, seed from results where schedule = ? and station = ? and startTime = ? and flags = ? order by beamSize",
+                              (schedule,station,startTime,flags)).fetchall())
+
+# store the result of a search: the route found by the search itself and the distance of the
+# stored route it started with (seed, 0.0 for none); an earlier search with the same key may
+# have found a longer route
+def writeResult(connection,key,distance,route,seed,complete,steps,seconds):
+    stored = connection.execute("select distance, route, complete, seed from results where schedule = ? and station = ? and startTime = ? and beamSize = ? and flags = ?",key).fetchone()
+    if stored is not None:
+        if stored[0] > distance: distance,route,seed = stored[0],stored[1],stored[3]
+        complete = complete or stored[2]
+    try:
+        with connection:
+            connection.execute("insert or replace into results values (?,?,?,?,?,?,?,?,?,?,?)",key+(distance,route,int(complete),steps,seconds,seed))
+    except sqlite3.Error as e: sys.exit(COMMAND+": cannot write results file "+resultsFile+": "+str(e)+"\n")
+
+# use the stored results of earlier searches: return True if a search with the same beam size
+# was completed (its route is shown), otherwise start with the longest route of the other
+# searches: only longer routes are shown and with -x it prunes the search from the start
+def useStoredResults(state,storedResults):
+    for storedBeamSize,distance,route,complete,seed in storedResults:
+        if storedBeamSize == state.beamSize and complete:
+            sys.stdout.write(route)
+            if route == "": print("# no route longer than the stored route of %0.1f km" % (seed))
+            print("# search complete (stored result)")
+            return(True)
+    for storedBeamSize,distance,route,complete,seed in storedResults:
+        if route != "" and distance > state.maxDistance:
+            state.maxDistance = distance
+            state.bestRoute = route
+            sys.stdout.write(route)
+    return(False)
+
+# read the train trips (the text of a train trips file) and the data files and build the index,
+# or load the train trips and the index from the index cache; the stations must have been read
+def loadNetwork(trainTripsText,useIndexCache=True):
+    global trainTrips,connections,trackIds,trackStations,timeDistanceWidth,transfers,next_destinations
+    global index,indexStats,partners,can_travel_back,requiredVisits
+
+    startTime = time.time()
+    cache = None
+    if useIndexCache:
+        cacheKey = indexCacheKey(trainTripsText)
+        cache = readIndexCache(cacheKey)
+    if cache is None: trainTrips, connections = readTrainTrips(io.StringIO(trainTripsText))
+    else: 
+        trainTrips, connections = cache["trainTrips"], cache["connections"]
+        trackIds, trackStations = cache["trackIds"], cache["trackStations"]
+    timings["read"] = time.time()-startTime
+    # routes may end later than the last time of the time-distance file
+    if len(trainTrips["endTime"]) > 0:
+        timeDistanceWidth = max(TIMEDISTANCEMAXPLUSONE,max(trainTrips["endTime"])+1)
+    transfers = readTransfers()
+    # makeIndex uses the next destinations for ordering the index
+    next_destinations = read_next_destinations()
+    if cache is None:
+        startTime = time.time()
+        index = makeIndex(trainTrips,transfers)
+        timings["index"] = time.time()-startTime
+        if useIndexCache:
+            writeIndexCache(cacheKey,{"trainTrips":trainTrips,"connections":connections,"trackIds":trackIds,"trackStations":trackStations,"index":index,"indexStats":indexStats})
+    else: 
+        index,indexStats = cache["index"],cache["indexStats"]
+        indexStats["cached"] = True
+        timings["index"] = 0.0
+    partners = readPartners()
+    can_travel_back = read_can_travel_back()
+    makeTrackMasks()
+    requiredVisits = readRequiredVisits()
+    makeVisitTables()
+
+# add the index entries for routes that start at startTime, like makeIndex does for the start
+# time of the search (globalStartTime), if they are missing
+def addStartKeys(index,startTime):
+    tracksFrom = makeTracksFrom(trainTrips)
+    for i in range(0,len(trainTrips["startTime"])):
+        if trainTrips["startTime"][i] <= MAXWAIT:
+            station = trainTrips["endStation"][i]
+            key = (station,startTime)
+            if not key in index: index[key] = {}
+            if not station in index[key]: 
+                index[key][station] = makeIndexEntry(trainTrips,transfers,tracksFrom,key,station)
+                upperBoundsCache.clear()
+
+# a loaded network (train trips, data files and index) for searching routes in other programs:
+#    planner = RoutePlanner(trainTripsText)
+#    routes = planner.search("meppel","00:04",20,timeLimit=60)
+# The data files are read from the current directory. Each planner keeps its own index and
+# time-distance data and each search its own SearchState, so searches of different planners
+# can run in several threads at the same time; searches of one planner run one at a time. The
+# code that reads the network works with module variables: loading a network and adding index
+# entries for a start time are done one at a time (plannerLock). Errors raise ValueError
+class RoutePlanner:
+    def __init__(self,trainTripsText,ignoreTransferTimes=False,useIndexCache=False):
+        global stations,stationNames
+
+        self.network = copy.deepcopy({ name:initialVariables[name] for name in NETWORKVARIABLES })
+        self.network["ignoreTransferSafetyTimes"] = ignoreTransferTimes
+        self.lock = threading.Lock()
+        with self.variables():
+            stations = readStations()
+            stationNames = list(stations)
+            loadNetwork(trainTripsText,useIndexCache)
+            self.timings = dict(timings)
+
+    # put the network of the planner in the module variables; save the network and restore the
+    # earlier values of the variables afterwards
+    @contextlib.contextmanager
+    def variables(self):
+        with plannerLock:
+            saved = { name:globals()[name] for name in NETWORKVARIABLES }
+            globals().update(self.network)
+            try: yield()
+            except SystemExit as exception: raise ValueError(str(exception.code).strip()) from None
+            finally:
+                self.network = { name:globals()[name] for name in NETWORKVARIABLES }
+                globals().update(saved)
+
+    # search the longest routes from the first station start (None: all stations) that start at
+    # startTime (HH:MM or minutes, up to 23:59; not 00:00: with a trip leaving at that time), with a beam size
+    # and optional limits on the seconds and the steps of the search. Other options: allDepartures
+    # (-a), branchAndBound (-x), blockTurningBack (-B), ordering (-o), memo (--memo) and top
+    # (--top, with different: --different). Like -n, each search starts without best distances
+    # unless keepBestDistances is set: then the beam uses the best distances of earlier searches.
+    # Returns the routes found, the longest first: every longer route found during the search
+    # or, with top, the longest diverse routes. The steps and seconds of the search and the limit
+    # that stopped it, if any, are stored in the attribute stats
+    def search(self,start=None,startTime=TIMEZERO,beam=20,timeLimit=None,nodeLimit=None,allDepartures=False,
+               branchAndBound=False,blockTurningBack=False,ordering="speed",memo=0,top=0,different=MINDIFFERENTTRACKS,
+               keepBestDistances=False):
+        minutes = startTime2minutes(startTime) if isinstance(startTime,str) else startTime
+        if not isinstance(minutes,int) or minutes < TIMEZERO or minutes > TIMEZERO+DAYTIME:
+            raise ValueError("unexpected start time: "+str(startTime))
+        startTime = minutes
+        if not ordering in ORDERINGS: raise ValueError("unknown ordering: "+str(ordering))
+        if start is not None and not start in self.network["stations"]: raise ValueError("unknown first station: "+start)
+        with self.lock:
+            # the index of the planner is built for the start time TIMEZERO (globalStartTime of the
+            # network): other start times get extra index entries
+            if startTime != TIMEZERO:
+                with self.variables(): addStartKeys(index,startTime)
+            if not keepBestDistances: self.network["timeDistance"],self.network["timeDistanceRows"] = array("d"),{}
+            state = SearchState(self.network)
+            state.beamSize,state.firstStation,state.globalStartTime = float(beam),"" if start is None else start,startTime
+            state.allDepartures,state.branchAndBound,state.block_turning_back = allDepartures,branchAndBound,blockTurningBack
+            state.ordering,state.timeLimit,state.nodeLimit = ordering,timeLimit,nodeLimit
+            state.memoSize,state.topSize,state.minDifferentTracks = memo,top,different
+            state.maxTime = computeMaxTime(self.network,startTime)
+            state.routeCollector = []
+            startSearchStats(state)
+            if timeLimit is not None: state.deadline = state.searchStats["startTime"]+timeLimit
+            try: findRoute(state,self.network["index"],[],0,0)
+            except SystemExit as exception: raise ValueError(str(exception.code).strip()) from None
+            if state.topSize > 0: routes = [ Route(distance,trips) for distance,tracks,report,trips in state.topRoutes ]
+            else: routes = [ Route(distance,trips) for distance,report,trips in state.routeCollector ]
+            self.stats = {"steps":state.searchStats["steps"],"stopped":state.searchStats["stopped"],
+                          "seconds":time.time()-state.searchStats["startTime"]}
+        return(sorted(routes,key=lambda route: route.distance,reverse=True))
+
+# search the longest route: from all start stations, from the route of the history file or
+# from the route of the checkpoint
+def search(state,index):
+    if historyFile == "" and nbrOfProcesses > 1:
+        findRouteParallel(state,index,nbrOfProcesses,splitStartTrips)
+    elif historyFile == "": 
+        findRoute(state,index,[],0,0)
+    elif state.checkpoint is not None:
+        checkpoint = state.checkpoint
+        state.maxTime = checkpoint["maxTime"]
+        findRoute(state,index,checkpoint["route"],checkpoint["travelled"],checkpoint["distance"],checkpoint["frames"])
+    else:
+        readRouteResults = readRoute(state,historyFile)
+        findRoute(state,index,readRouteResults["route"],readRouteResults["travelled"],readRouteResults["distance"])
+
+# search with increasing beam sizes, from 0 up to the beam size: a first route is found quickly
+# and longer routes are found while the time and node limits allow it. Each search starts with
+# the time-distance data of before the first search: with the data of a search with a smaller
+# beam size, most routes would be skipped. The best distances of all searches are kept
+def searchWidening(state,index):
+    network = state.network
+    finalBeamSize = state.beamSize
+    state.beamSize = 0.0
+    startTable = array("d",network["timeDistance"])
+    bestTable = array("d",network["timeDistance"])
+    while True:
+        print("# beam size : %g" % (state.beamSize))
+        search(state,index)
+        # a parallel search replaces the table
+        timeDistance = network["timeDistance"]
+        bestTable = array("d",map(max,bestTable,timeDistance))+timeDistance[len(bestTable):]
+        # a beam size larger than the longest route does not skip any route
+        if state.searchStats["stopped"] is not None or state.beamSize >= finalBeamSize or state.beamSize > state.maxDistance: break
+        state.beamSize = min(state.beamSize+state.beamWidening,finalBeamSize)
+        timeDistance[:] = startTable+array("d",[NOROUTE])*(len(timeDistance)-len(startTable))
+    timeDistance[:] = bestTable
 
 def check_track_reverse(track):
     if track in can_travel_back:
         return "can_travel_back"
     else:
-        start_station, end_station = track.split()
+        start_station, end_station = trackStations[track]
         distance = connections[start_station][end_station]
         for middle_station in connections[start_station]:
             if (end_station in connections[middle_station] and
                 connections[middle_station][end_station] + connections[start_station][middle_station] == distance):
-                return f"via_travel_back({middle_station})"
+                return f"via_travel_back({stationNames[middle_station]})"
         return ""
 
 
 def showSpeeds(index):
     speeds = {}
     for key in index:
-        startStation, time = key.split()
         for prevStartStation in index[key]:
             for endStation in index[key][prevStartStation]:
-                track = startStation+" "+endStation
+                trip = index[key][prevStartStation][endStation][0]
+                track = trainTrips["track"][trip]
                 if track not in speeds: 
                     speeds[track] = {}
-                speeds[track][int(index[key][prevStartStation][endStation][0]["averageSpeed"])] = True
+                speeds[track][int(trainTrips["averageSpeed"][trip])] = True
     for track in speeds:
         for speed in sorted(speeds[track],reverse=True): 
             print(speed, end=" ")
-        print(track, check_track_reverse(track))
+        print(trackName(track), check_track_reverse(track))
 
 
-def check_station_names(stations):
-    for station in stations:
+def check_station_names(names):
+    for station in names:
         if not station in stations:
             sys.exit(COMMAND + ": unknown station in file " + CANTRAVELBACK + ": " + station + "\n")
 
@@ -494,8 +1873,9 @@ def read_can_travel_back():
     for line in in_file:
         station_1, station_2 = line.strip().split()
         check_station_names([ station_1, station_2 ] )
-        can_travel_back[f"{station_1} {station_2}"] = True
-        can_travel_back[f"{station_2} {station_1}"] = True
+        track = getTrack(stations[station_1], stations[station_2])
+        can_travel_back[track] = True
+        can_travel_back[reverseTrack(track)] = True
     in_file.close()
     return can_travel_back
 
@@ -508,12 +1888,12 @@ def read_next_destinations():
     except:
         sys.exit(COMMAND + ": cannot read file " + NEXTDESTINATIONS + "\n")
     for line in in_file:
-        stations = line.strip().split()
-        check_station_names(stations)
-        track = " ".join(stations[:2])
+        names = line.strip().split()
+        check_station_names(names)
+        track = getTrack(stations[names[0]], stations[names[1]])
         if track in next_destinations:
-            sys.exit(COMMAND + f": read_next_destinations: duplicate track {track}\n")
-        next_destinations[track] = stations[2:]
+            sys.exit(COMMAND + f": read_next_destinations: duplicate track {trackName(track)}\n")
+        next_destinations[track] = [ stations[name] for name in names[2:] ]
     in_file.close()
     return next_destinations
 
@@ -529,66 +1909,153 @@ def readPartners():
         if patternHashStart.match(line): continue
         fields = line.split()
         if len(fields) < 5: sys.exit(COMMAND+": unexpected line in file "+PARTNERFILE+": "+line+"\n")
-        station1,station2,station3,station4,distance = fields
-        distance = float(distance)
+        distance = float(fields[4])
         for station in fields[0:4]:
             if not station in stations:
                 sys.exit(COMMAND+": unknown station in file "+PARTNERFILE+": "+station+"\n")
-        if not station1+" "+station2 in partners: partners[station1+" "+station2] = []
-        if not station2+" "+station1 in partners: partners[station2+" "+station1] = []
-        if not station3+" "+station4 in partners: partners[station3+" "+station4] = []
-        if not station4+" "+station3 in partners: partners[station4+" "+station3] = []
-        partners[station1+" "+station2].append({"partner":station3+" "+station4,"distance":distance})
-        partners[station2+" "+station1].append({"partner":station4+" "+station3,"distance":distance})
-        partners[station3+" "+station4].append({"partner":station1+" "+station2,"distance":distance})
-        partners[station4+" "+station3].append({"partner":station2+" "+station1,"distance":distance})
+        track12 = getTrack(stations[fields[0]],stations[fields[1]])
+        track34 = getTrack(stations[fields[2]],stations[fields[3]])
+        for track in [track12,reverseTrack(track12),track34,reverseTrack(track34)]:
+            if not track in partners: partners[track] = []
+        # partners: lists of (partner track, length of shared section)
+        partners[track12].append((track34,distance))
+        partners[reverseTrack(track12)].append((reverseTrack(track34),distance))
+        partners[track34].append((track12,distance))
+        partners[reverseTrack(track34)].append((reverseTrack(track12),distance))
     inFile.close()
     return(partners)
 
-def main(argv):
-    global beamSize, block_turning_back, connections, doShowSpeeds, firstStation
-    global globalStartTime, historyFile, ignoreTransferSafetyTimes, index
-    global next_destinations, partners, resetBestDistances, stations, transfers
-    global trainTrips, maxDistance, timeDistance, maxTime, can_travel_back
+# read the command line options: the search options go in the search state, the other options
+# in module variables; returns the options for the results key
+def readOptions(state,argv):
+    global doShowSpeeds, globalStartTime, historyFile, ignoreTransferSafetyTimes, nbrOfProcesses
+    global replanFile, resetBestDistances, resultsFile, splitStartTrips
 
-    stations = readStations()
-    options,args = getopt.getopt(argv,"b:f:hH:ins:BS")
+    options,args = getopt.getopt(argv,OPTIONS,LONGOPTIONS)
     if len(args) > 0: sys.exit(COMMAND+": unexpected extra argument: "+args[0])
+    # continue an interrupted search: use the options of that search
+    if ("--resume","") in options:
+        if len(options) > 1: sys.exit(COMMAND+": --resume cannot be combined with other options\n")
+        state.checkpoint = readCheckpoint()
+        argv = state.checkpoint["options"]
+        options,args = getopt.getopt(argv,OPTIONS,[ option for option in LONGOPTIONS if not option in ["replan=","resume"] ])
+    state.searchOptions = argv
     for option,value in options:
-        if option == "-b": beamSize = float(value)
-        elif option == "-f": firstStation = value
+        if option == "-a": state.allDepartures = True
+        elif option == "-b": state.beamSize = float(value)
+        elif option == "--different":
+            if not re.match("^[1-9][0-9]*$",value):
+                sys.exit(COMMAND+": unexpected number of tracks for --different: "+value+"\n")
+            state.minDifferentTracks = int(value)
+        elif option == "-f": state.firstStation = value
         elif option == "-h": help()
         elif option == "-H": historyFile = value
         elif option == "-i": 
            ignoreTransferSafetyTimes = True
+        elif option == "-j":
+            if not re.match("^[1-9][0-9]*$",value):
+                sys.exit(COMMAND+": unexpected number of processes for -j: "+value+"\n")
+            nbrOfProcesses = int(value)
+        elif option == "--memo":
+            if not re.match("^[0-9]+$",value):
+                sys.exit(COMMAND+": unexpected number of states for --memo: "+value+"\n")
+            state.memoSize = int(value)
         elif option == "-n": resetBestDistances = True
-        elif option == "-s": globalStartTime = value
-        elif option == "-B": block_turning_back = True
+        elif option == "-o":
+            if not value in ORDERINGS:
+                sys.exit(COMMAND+": unexpected ordering for -o: "+value+"\n")
+            state.ordering = value
+        elif option == "-p": splitStartTrips = True
+        elif option == "--replan": replanFile = value
+        elif option == "--results": resultsFile = value
+        elif option == "-s":
+            if startTime2minutes(value) is None:
+                sys.exit(COMMAND+": unexpected start time argument value for -s: "+value+"\n")
+            globalStartTime = state.globalStartTime = startTime2minutes(value)
+        elif option == "--node-limit":
+            if not re.match("^[1-9][0-9]*$",value):
+                sys.exit(COMMAND+": unexpected number of steps for --node-limit: "+value+"\n")
+            state.nodeLimit = int(value)
+        elif option == "--stats": state.statsFile = value
+        elif option == "--time-limit":
+            if not re.match(r"^[0-9]+(\.[0-9]*)?$",value):
+                sys.exit(COMMAND+": unexpected number of seconds for --time-limit: "+value+"\n")
+            state.timeLimit = float(value)
+        elif option == "--top":
+            if not re.match("^[1-9][0-9]*$",value):
+                sys.exit(COMMAND+": unexpected number of routes for --top: "+value+"\n")
+            state.topSize = int(value)
+        elif option == "--widen":
+            if not re.match(r"^[0-9]+(\.[0-9]*)?$",value) or float(value) <= 0:
+                sys.exit(COMMAND+": unexpected beam step for --widen: "+value+"\n")
+            state.beamWidening = float(value)
+        elif option == "-x": state.branchAndBound = True
+        elif option == "-B": state.block_turning_back = True
         elif option == "-S": doShowSpeeds = True
-    if firstStation != "" and not firstStation in stations:
-        sys.exit(COMMAND+": unknown first station: "+firstStation+"\n")
-    patternTime = re.compile("^\d\d:\d\d$")
-    if not patternTime.match(globalStartTime):
-        sys.exit(COMMAND+": unexpected start time argument value for -s: "+globalStartTime+"\n")
+    if state.firstStation != "" and not state.firstStation in stations:
+        sys.exit(COMMAND+": unknown first station: "+state.firstStation+"\n")
+    if resultsFile != "" and (historyFile != "" or replanFile != ""):
+        sys.exit(COMMAND+": --results cannot be combined with -H or --replan\n")
+    if state.topSize > 0 and replanFile != "":
+        sys.exit(COMMAND+": --top cannot be combined with --replan\n")
+    return(options)
+
+# run the search of the command line, with its limits, and show its results
+def searchCommandLine(state,index):
+    startSearchStats(state)
+    if state.timeLimit is not None: state.deadline = state.searchStats["startTime"]+state.timeLimit
+    state.nextTopTime = time.time()+TOPINTERVAL
+    if state.beamWidening is None: search(state,index)
+    else: searchWidening(state,index)
+    if state.topChanged: showTopRoutes(state)
+    if state.timeLimit is not None or state.nodeLimit is not None or state.beamWidening is not None: printSearchStats(state)
+
+def main(argv):
+    global stations, stationNames, resetBestDistances
+
+    stations = readStations()
+    stationNames = list(stations)
+    # the command line program searches the network of the module variables
+    state = SearchState(globals())
+    options = readOptions(state,argv)
+    if state.checkpoint is not None:
+        # the time-distance table was saved with the checkpoint
+        resetBestDistances = False
+        state.maxDistance = state.checkpoint["maxDistance"]
+        state.bestRoute = state.checkpoint["bestRoute"]
+        sys.stdout.write(state.bestRoute)
     
-    maxTime = computeMaxTime(globalStartTime) # needs function to be computed
-    if not resetBestDistances: timeDistance = readTimeDistance()
-    trainTrips, connections = readTrainTrips()
-    transfers = readTransfers()
-    index = makeIndex(trainTrips,transfers)
-    partners = readPartners()
-    can_travel_back = read_can_travel_back()
-    next_destinations = read_next_destinations()
+    trainTripsText = sys.stdin.read()
+    loadNetwork(trainTripsText)
+    state.maxTime = computeMaxTime(state.network,globalStartTime)
+    if not resetBestDistances and not readTimeDistanceTable(): readTimeDistance()
     if doShowSpeeds: 
         showSpeeds(index)
         sys.exit()
        
-    if historyFile == "": 
-        findRoute(index,[],{},0)
-    else:
-        readRouteResults = readRoute(historyFile)
-        findRoute(index,readRouteResults["route"],readRouteResults["travelled"],readRouteResults["distance"])
-    writeTimeDistance(timeDistance)
+    stored = False
+    if resultsFile != "":
+        results = openResults(resultsFile)
+        resultsKey = (scheduleHash(trainTripsText),state.firstStation,minutes2time(globalStartTime),state.beamSize,resultsFlags(options))
+        searchDistance,searchRoute = state.maxDistance,state.bestRoute
+        stored = useStoredResults(state,readResults(results,resultsKey))
+        seedDistance = state.maxDistance if state.maxDistance > searchDistance else 0.0
+    if replanFile != "": replan(state,index,replanFile)
+    elif not stored:
+        searchCommandLine(state,index)
+        if resultsFile != "":
+            # store only the route found by this search, not the stored route it started with
+            searchStats = state.searchStats
+            if seedDistance == 0.0 or searchStats["firstRouteTime"] is not None: searchDistance,searchRoute = state.maxDistance,state.bestRoute
+            writeResult(results,resultsKey,searchDistance,searchRoute,seedDistance,searchStats["stopped"] is None,
+                        searchStats["steps"],time.time()-searchStats["startTime"])
+    if state.statsFile != "": writeStats(state)
+    # replanning does not change the time-distance files
+    if replanFile == "":
+        writeTimeDistanceTable(timeDistance)
+        writeTimeDistance(timeDistance)
+        # the search is complete: not stopped by a limit and not skipped for a stored result
+        if not stored and state.searchStats["stopped"] is None and os.path.exists(CHECKPOINTFILE): os.remove(CHECKPOINTFILE)
 
 if __name__ == "__main__":
-    sys.exit(main(sys.argv))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# sweep.py: search routes for all combinations of first stations, start times and beam sizes,
+#           skipping the combinations for which the results file has a completed search
+# usage: sweep.py [-b beam-sizes] [-f first-stations] [-l] [-r results-file] [-s start-times] [-x options] [file]
+# -b: beam sizes, separated by commas (default: 0,10,20)
+# -f: first stations, separated by commas (default: all stations of the file stations)
+# -l: list the combinations and their stored results, do not search
+# -r: SQLite results file of findRoute.py (default: results.db)
+# -s: start times HH:MM, separated by commas (default: 00:00)
+# -x: other options for findRoute.py, for example "-a --time-limit 600"
+# note: the searches run one at a time, from the smallest beam size to the largest, and
+#       share the file time-distance; searches stopped by a limit are run again
+
+import getopt
+import os
+import shlex
+import subprocess
+import sys
+
+import findRoute
+import traintrips
+
+DATA_FILE_NAME = traintrips.DATA_FILE_NAME
+RESULTS_FILE_NAME = "results.db"
+BEAM_SIZES = "0,10,20"
+START_TIMES = "00:00"
+FIND_ROUTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "findRoute.py")
+
+
+def combinations(beam_sizes, start_times, first_stations):
+    """the searches of the sweep in the order in which they are run"""
+    return [(beam_size, start_time, first_station)
+            for beam_size in sorted(beam_sizes) for start_time in start_times for first_station in first_stations]
+
+
+def stored_results(results_file_name, schedule, flags):
+    """the stored results for the schedule and the flags: (beam size, start time, station) -> (distance, complete,
+    seeded); a search that started with a stored route (seed) and found no longer route stores no route: its
+    result is the seed and seeded is True"""
+    connection = findRoute.openResults(results_file_name)
+    rows = connection.execute("select beamSize, startTime, station, distance, complete, seed from results "
+                              "where schedule = ? and flags = ?", (schedule, flags)).fetchall()
+    connection.close()
+    return {(beam_size, start_time, station): (max(distance, seed), complete == 1, seed > distance)
+            for beam_size, start_time, station, distance, complete, seed in rows}
+
+
+def search(data_file_name, results_file_name, beam_size, start_time, first_station, options):
+    """run findRoute.py for one combination, return its exit code"""
+    command = [sys.executable, FIND_ROUTE, "-b", f"{beam_size:g}", "-s", start_time, "-f", first_station,
+               "--results", results_file_name] + options
+    print(f"# {' '.join(command[1:])}", flush=True)
+    with open(data_file_name, "r") as data_file:
+        return subprocess.run(command, stdin=data_file).returncode
+
+
+def main(argv):
+    options, args = getopt.getopt(argv, "b:f:lr:s:x:")
+    options = dict(options)
+    data_file_name = args[0] if len(args) > 0 else DATA_FILE_NAME
+    results_file_name = options.get("-r", RESULTS_FILE_NAME)
+    beam_sizes = [float(beam_size) for beam_size in options.get("-b", BEAM_SIZES).split(",")]
+    start_times = options.get("-s", START_TIMES).split(",")
+    first_stations = options["-f"].split(",") if "-f" in options else list(findRoute.readStations())
+    find_route_options = shlex.split(options.get("-x", ""))
+    # findRoute.py stores its results per schedule and per options that change the search
+    find_route_option_pairs, _ = getopt.getopt(find_route_options, findRoute.OPTIONS, findRoute.LONGOPTIONS)
+    with open(data_file_name, "r") as data_file:
+        schedule = findRoute.scheduleHash(data_file.read())
+    stored = stored_results(results_file_name, schedule, findRoute.resultsFlags(find_route_option_pairs))
+    missing = 0
+    for beam_size, start_time, first_station in combinations(beam_sizes, start_times, first_stations):
+        distance, complete, seeded = stored.get((beam_size, start_time, first_station), (None, False, False))
+        if "-l" in options:
+            status = "complete" if complete else ("missing" if distance is None else "stopped")
+            if seeded:
+                status += " (seed)"
+            print(f"{beam_size:g} {start_time} {first_station} {0.0 if distance is None else distance:0.1f} {status}")
+        elif not complete:
+            exit_code = search(data_file_name, results_file_name, beam_size, start_time, first_station, find_route_options)
+            if exit_code != 0:
+                sys.exit(f"sweep.py: findRoute.py failed for beam size {beam_size:g}, start time {start_time}, "
+                         f"first station {first_station}")
+        if not complete:
+            missing += 1
+    print(f"# {missing} of {len(beam_sizes) * len(start_times) * len(first_stations)} searches "
+          f"{'to do' if '-l' in options else 'done'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,76 @@
+# traintrips.py: read and write the train trips file traintrips.txt
+# usage: import traintrips; for record in traintrips.read_trips(data_file): ...
+# note: the file contains track lines: hash sign, distance, start station and end station,
+#       each followed by the trips on the track: start time, end time, number of transfers
+#       and travel time, often on four separate lines
+
+import re
+import sys
+from collections import namedtuple
+
+DATA_FILE_NAME = "traintrips.txt"
+
+PATTERN_DISTANCE = re.compile(r"^\d+(\.\d+)?$")
+PATTERN_TIME = re.compile(r"^\d\d:\d\d$")
+PATTERN_TRANSFERS = re.compile(r"^\d+$")
+PATTERN_TRAVEL_TIME = re.compile(r"^\d+:\d\d$")
+
+# times are stored as minutes since 00:00 of the first day
+Track = namedtuple("Track", ["distance", "start_station", "end_station", "line_number"])
+Trip = namedtuple("Trip", ["track", "start_time", "end_time", "transfers", "travel_time", "line_number"])
+
+
+def time_to_minutes(time):
+    hours, minutes = time.split(":")
+    return 60 * int(hours) + int(minutes)
+
+
+def minutes_to_time(minutes):
+    return "%02d:%02d" % divmod(minutes, 60)
+
+
+def error(file_name, line_number, message):
+    sys.exit(f"{file_name}, line {line_number}: {message}")
+
+
+def read_trips(data_file=None, file_name="stdin"):
+    """yield the tracks and trips of a train trips file in file order, one line at a time;
+       each Track is followed by the Trips on the track"""
+    if data_file is None:
+        data_file = sys.stdin
+    track = None
+    fields = []
+    line_number = 0
+    for line in data_file:
+        line_number += 1
+        if line.startswith("#"):
+            if len(fields) > 0:
+                error(file_name, line_number, f"incomplete train trip: {' '.join(fields)}")
+            values = line.split()
+            if len(values) != 4:
+                error(file_name, line_number, f"unexpected track line: {line.strip()}")
+            if not PATTERN_DISTANCE.match(values[1]):
+                error(file_name, line_number, f"missing distance on line: {line.strip()}")
+            track = Track(float(values[1]), values[2], values[3], line_number)
+            yield track
+        else:
+            fields.extend(line.split())
+            if len(fields) > 4:
+                error(file_name, line_number, f"unexpected schedule data (quantity): {' '.join(fields)}")
+            if len(fields) == 4:
+                if track is None:
+                    error(file_name, line_number, "train trip before first track line")
+                if not PATTERN_TIME.match(fields[0]) or not PATTERN_TIME.match(fields[1]):
+                    error(file_name, line_number, f"unexpected schedule data (times): {' '.join(fields)}")
+                if not PATTERN_TRANSFERS.match(fields[2]) or not PATTERN_TRAVEL_TIME.match(fields[3]):
+                    error(file_name, line_number, f"unexpected schedule data (transfers, travel time): {' '.join(fields)}")
+                yield Trip(track, time_to_minutes(fields[0]), time_to_minutes(fields[1]), int(fields[2]),
+                           time_to_minutes(fields[3]), line_number)
+                fields = []
+    if len(fields) > 0:
+        error(file_name, line_number, f"incomplete train trip at end of file: {' '.join(fields)}")
+
+
+def format_trip(start_time, end_time, transfers, travel_time):
+    """return the four lines of a trip in a train trips file"""
+    return f"{minutes_to_time(start_time)}\n{minutes_to_time(end_time)}\n{transfers}\n{travel_time // 60}:{travel_time % 60:02d}"